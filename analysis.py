@@ -5,15 +5,52 @@ This module provides functionality for analyzing and updating the master Excel f
 """
 
 # Standard library imports
+import logging
+import os
+import pickle
 from pathlib import Path
 from typing import Optional, Dict, Any, Union
 import re
 
 # Third-party imports
+import numpy as np
 import pandas as pd
 
 # Local imports
 import config
+from append import apply_header_formatting, clean_column_names, read_header_formatting
+
+
+logger = logging.getLogger(__name__)
+
+# Matches every kind of History update in one pass, e.g.
+# "Updated product price to $200.", "Updated capacity allocation to 62.5%.",
+# "Updated initial standard batch size to 125 units." and
+# "Updated final standard batch size to 28 units."
+_HISTORY_RE = re.compile(
+    r'price.*?\$(?P<Price>\d+)'
+    r'|capacity allocation.*?to (?P<Allocation>\d+\.?\d*)'
+    r'|initial standard batch size.*?to (?P<InitialBatchSize>\d+) units'
+    r'|final standard batch size.*?to (?P<FinalBatchSize>\d+) units'
+)
+
+# Columns the add_* methods add to the Standard sheet
+_DERIVED_COLUMNS = ['Current Price', 'Capacity Allocation %', 'Initial Batch Size', 'Final Batch Size']
+
+# Literal substrings every update matched by _HISTORY_RE contains. Descriptions
+# are lowercased and checked for these first, so the regex only runs on
+# descriptions that can actually match.
+_HISTORY_KEYWORDS = ('price', 'capacity allocation', 'standard batch size')
+
+# Dtype of each value captured by _HISTORY_RE. Prices and batch sizes fit
+# comfortably in 32 bits; allocations stay float64 so that rounded
+# percentages such as 33.33 are written to Excel exactly.
+_UPDATE_DTYPES = {
+    'Price': 'int32',
+    'Allocation': 'float64',
+    'InitialBatchSize': 'int32',
+    'FinalBatchSize': 'int32',
+}
 
 
 class DataAnalyzer:
@@ -24,6 +61,7 @@ class DataAnalyzer:
     - Adding current price information based on history
     - Adding capacity allocation information based on history
     - Adding initial and final batch size information based on history
+    - Saving the updated data back to the master file in a single write
     """
     
     def __init__(self, master_file_path: Optional[Union[str, Path]] = None) -> None:
@@ -38,6 +76,9 @@ class DataAnalyzer:
             self.master_file_path = Path(master_file_path)
         
         self.data: Optional[Dict[str, pd.DataFrame]] = None
+        self._updates: Optional[Dict[str, pd.DataFrame]] = None
+        self._sorted_days: Optional[pd.DataFrame] = None
+        self._loaded_derived_columns: Optional[pd.DataFrame] = None
         self.load_data()
     
     def load_data(self) -> None:
@@ -48,21 +89,81 @@ class DataAnalyzer:
             ValueError: If the file is not a valid Excel file
         """
         try:
+            config.validate_paths()
             if not self.master_file_path.exists():
                 raise FileNotFoundError(f"Master file not found: {self.master_file_path}")
             
-            self.data = pd.read_excel(
-                self.master_file_path,
-                sheet_name=None,
-                keep_default_na=False,
-                na_filter=False
-            )
-            print("Successfully loaded data from master file")
+            self.data = self._load_cached_data()
+            if self.data is None:
+                self.data = pd.read_excel(
+                    self.master_file_path,
+                    engine='calamine',
+                    sheet_name=None,
+                    keep_default_na=False,
+                    na_filter=False
+                )
+                self._save_cached_data()
+            self._updates = None
+            self._sorted_days = None
+            self._loaded_derived_columns = self._get_derived_columns()
+            logger.info("Successfully loaded data from master file")
         except Exception as e:
-            print(f"Error loading data: {str(e)}")
+            logger.error("Error loading data: %s", e)
             self.data = None
             raise
     
+    def _get_derived_columns(self) -> Optional[pd.DataFrame]:
+        """Get the columns added by the add_* methods from the Standard sheet.
+        
+        Values are normalized to float so that columns read back from Excel
+        compare equal to freshly computed ones.
+        
+        Returns:
+            DataFrame with Day and the derived columns, or None if any is missing.
+        """
+        standard = self.data.get('Standard') if self.data else None
+        if standard is None or not all(col in standard.columns for col in _DERIVED_COLUMNS):
+            return None
+        columns = standard[['Day'] + _DERIVED_COLUMNS].apply(pd.to_numeric, errors='coerce')
+        return columns.astype('float64').reset_index(drop=True)
+    
+    def _load_cached_data(self) -> Optional[Dict[str, pd.DataFrame]]:
+        """Load the parsed master file from its pickle cache if it is still current.
+        
+        The cache is only used when it was written for the master file's current
+        modification time, so any rewrite of the master file invalidates it.
+        main.run_all rewrites the master file with append_to_master before every
+        analysis, so the cache only helps analysis runs on an unchanged master
+        file, such as running analysis.py on its own.
+        
+        Returns:
+            The cached sheets, or None if there is no usable cache.
+        """
+        cache_file = self.master_file_path.with_suffix('.pkl')
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if not isinstance(cached, dict) or not isinstance(cached.get('data'), dict):
+                raise ValueError("not a master file cache")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable cache %s: %s", cache_file, e)
+            return None
+        
+        if cached.get('mtime') != os.path.getmtime(self.master_file_path):
+            return None
+        return cached['data']
+    
+    def _save_cached_data(self) -> None:
+        """Save the parsed master file to its pickle cache for the next run."""
+        cache_file = self.master_file_path.with_suffix('.pkl')
+        try:
+            with open(cache_file, 'wb') as f:
+                pickle.dump({'mtime': os.path.getmtime(self.master_file_path), 'data': self.data}, f)
+        except Exception as e:
+            logger.warning("Could not write cache %s: %s", cache_file, e)
+    
     def get_sheet(self, sheet_name: str) -> Optional[pd.DataFrame]:
         """Get a specific sheet from the loaded data.
         
@@ -79,6 +180,66 @@ class DataAnalyzer:
             raise ValueError("No data loaded. Call load_data() first.")
         return self.data.get(sheet_name)
     
+    def _extract_all_updates(self, history: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Extract all price, capacity and batch size updates from the History sheet.
+        
+        Every description is matched against a single combined pattern, so the
+        History sheet is scanned once regardless of how many update types exist.
+        History descriptions repeat heavily, so the pattern is only run on the
+        unique descriptions and the matches are mapped back to each row.
+        
+        Args:
+            history: DataFrame containing the History sheet data.
+            
+        Returns:
+            Dict mapping each value column (Price, Allocation, InitialBatchSize,
+            FinalBatchSize) to a DataFrame with Day and that column, holding one
+            update per day sorted by Day.
+        """
+        descriptions = history['Description'].astype('category')
+        codes = descriptions.cat.codes.to_numpy()
+        categories = pd.Series(descriptions.cat.categories).str.lower()
+        candidates = np.zeros(len(categories), dtype=bool)
+        for keyword in _HISTORY_KEYWORDS:
+            candidates |= categories.str.contains(keyword, regex=False).to_numpy()
+        extracted = categories[candidates].str.extract(_HISTORY_RE).reindex(categories.index)
+        # History is read without NA filtering, so blank Day cells (notes rows,
+        # trailing empty rows) come in as '' and make the column object dtype;
+        # only rows with a numeric Day can be updates
+        days = pd.to_numeric(history['Day'], errors='coerce').to_numpy(dtype='float64')
+        has_day = ~np.isnan(days)
+        
+        updates = {}
+        for column, dtype in _UPDATE_DTYPES.items():
+            # Build each small result frame straight from the matching rows
+            values = extracted[column].to_numpy()
+            matched = extracted[column].notna().to_numpy()
+            rows = np.flatnonzero((codes >= 0) & matched[codes] & has_day)
+            column_updates = pd.DataFrame({
+                'Day': days[rows],
+                column: values[codes[rows]].astype(dtype),
+            })
+            if column == 'Allocation':
+                column_updates[column] = column_updates[column].round(2)
+            # A stable sort keeps same-day updates in History order, so
+            # drop_duplicates keeps the first one listed for each day
+            column_updates = column_updates.sort_values('Day', kind='mergesort')
+            updates[column] = column_updates.drop_duplicates('Day')
+        return updates
+    
+    def _get_updates(self, history: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Get the updates extracted from the History sheet, extracting them on first use.
+        
+        Args:
+            history: DataFrame containing the History sheet data.
+            
+        Returns:
+            Dict of update DataFrames as returned by _extract_all_updates.
+        """
+        if self._updates is None:
+            self._updates = self._extract_all_updates(history)
+        return self._updates
+    
     def _extract_price_updates(self, history: pd.DataFrame) -> pd.DataFrame:
         """Extract price updates from the History sheet.
         
@@ -88,13 +249,7 @@ class DataAnalyzer:
         Returns:
             DataFrame containing price updates with Day and Price columns.
         """
-        price_updates = history[history['Description'].str.contains('price', case=False)].copy()
-        if not price_updates.empty:
-            price_updates['Price'] = price_updates['Description'].str.extract(r'\$(\d+)').astype(int)
-            price_updates = price_updates[['Day', 'Price']].sort_values('Day', ascending=False)
-            price_updates = price_updates.drop_duplicates('Day')
-            price_updates = price_updates.sort_values('Day')
-        return price_updates
+        return self._get_updates(history)['Price']
     
     def _extract_capacity_updates(self, history: pd.DataFrame) -> pd.DataFrame:
         """Extract capacity allocation updates from the History sheet.
@@ -105,14 +260,7 @@ class DataAnalyzer:
         Returns:
             DataFrame containing capacity updates with Day and Allocation columns.
         """
-        capacity_updates = history[history['Description'].str.contains('capacity allocation', case=False)].copy()
-        if not capacity_updates.empty:
-            capacity_updates['Allocation'] = capacity_updates['Description'].str.extract(r'to (\d+\.?\d*)').astype(float)
-            capacity_updates['Allocation'] = capacity_updates['Allocation'].round(2)
-            capacity_updates = capacity_updates[['Day', 'Allocation']].sort_values('Day', ascending=False)
-            capacity_updates = capacity_updates.drop_duplicates('Day')
-            capacity_updates = capacity_updates.sort_values('Day')
-        return capacity_updates
+        return self._get_updates(history)['Allocation']
     
     def _extract_initial_batch_size_updates(self, history: pd.DataFrame) -> pd.DataFrame:
         """Extract initial batch size updates from the History sheet.
@@ -123,14 +271,7 @@ class DataAnalyzer:
         Returns:
             DataFrame containing initial batch size updates with Day and InitialBatchSize columns.
         """
-        # Look for entries like "Updated initial standard batch size to 125 units."
-        batch_updates = history[history['Description'].str.contains('initial standard batch size', case=False)].copy()
-        if not batch_updates.empty:
-            batch_updates['InitialBatchSize'] = batch_updates['Description'].str.extract(r'to (\d+) units').astype(int)
-            batch_updates = batch_updates[['Day', 'InitialBatchSize']].sort_values('Day', ascending=False)
-            batch_updates = batch_updates.drop_duplicates('Day')
-            batch_updates = batch_updates.sort_values('Day')
-        return batch_updates
+        return self._get_updates(history)['InitialBatchSize']
     
     def _extract_final_batch_size_updates(self, history: pd.DataFrame) -> pd.DataFrame:
         """Extract final batch size updates from the History sheet.
@@ -141,14 +282,49 @@ class DataAnalyzer:
         Returns:
             DataFrame containing final batch size updates with Day and FinalBatchSize columns.
         """
-        # Look for entries like "Updated final standard batch size to 28 units."
-        batch_updates = history[history['Description'].str.contains('final standard batch size', case=False)].copy()
-        if not batch_updates.empty:
-            batch_updates['FinalBatchSize'] = batch_updates['Description'].str.extract(r'to (\d+) units').astype(int)
-            batch_updates = batch_updates[['Day', 'FinalBatchSize']].sort_values('Day', ascending=False)
-            batch_updates = batch_updates.drop_duplicates('Day')
-            batch_updates = batch_updates.sort_values('Day')
-        return batch_updates
+        return self._get_updates(history)['FinalBatchSize']
+    
+    def _get_sorted_days(self, standard: pd.DataFrame) -> pd.DataFrame:
+        """Get the Day column of the Standard sheet sorted by day, sorting it on first use.
+        
+        Args:
+            standard: DataFrame containing the Standard sheet data.
+            
+        Returns:
+            Single-column DataFrame of days in ascending order, keeping the
+            original row labels of standard.
+        """
+        if self._sorted_days is None:
+            self._sorted_days = standard[['Day']].sort_values('Day', kind='mergesort')
+        return self._sorted_days
+    
+    def _latest_values(self, standard: pd.DataFrame, updates: pd.DataFrame,
+                       value_column: str, default: Any) -> pd.Series:
+        """Look up the most recent update on or before each day of the Standard sheet.
+        
+        Args:
+            standard: DataFrame containing the Standard sheet data.
+            updates: DataFrame of updates with Day and value_column columns.
+            value_column: Name of the column in updates holding the updated value.
+            default: Value to use for days before the first update.
+            
+        Returns:
+            Series aligned to the index of standard with the value in effect on each day.
+        """
+        if updates.empty:
+            return pd.Series(default, index=standard.index)
+        
+        # Updates are already sorted by Day, as merge_asof requires, but their
+        # days come from History and must match the dtype of the Standard days
+        days = self._get_sorted_days(standard)
+        merged = pd.merge_asof(
+            days,
+            updates[['Day', value_column]].astype({'Day': days['Day'].dtype}),
+            on='Day',
+            direction='backward'
+        )
+        merged.index = days.index
+        return merged[value_column].fillna(default).reindex(standard.index)
     
     def add_current_price(self) -> None:
         """Add a column with current product price to the Standard sheet based on History updates.
@@ -156,11 +332,11 @@ class DataAnalyzer:
         This method:
         1. Extracts price updates from the History sheet
         2. Updates the Standard sheet with the most recent price for each day
-        3. Saves the updated data back to the master file
+        
+        Call flush() afterwards to save the updated data back to the master file.
         
         Raises:
             ValueError: If required sheets are not found
-            IOError: If there's an error saving the updated data
         """
         history = self.get_sheet('History')
         standard = self.get_sheet('Standard')
@@ -171,27 +347,12 @@ class DataAnalyzer:
         # Extract price updates
         price_updates = self._extract_price_updates(history)
         
-        # Initialize with default price
-        standard['Current Price'] = int(config.DEFAULT_PRICE)
+        # Carry the most recent price forward to every day
+        standard['Current Price'] = self._latest_values(
+            standard, price_updates, 'Price', config.DEFAULT_PRICE
+        ).astype(_UPDATE_DTYPES['Price'])
         
-        if not price_updates.empty:
-            min_update_day = price_updates['Day'].min()
-            
-            # Update price for each day based on the most recent update
-            for day in sorted(standard['Day'].unique()):
-                if day >= min_update_day:
-                    applicable_updates = price_updates[price_updates['Day'] <= day]
-                    if not applicable_updates.empty:
-                        latest_price = int(applicable_updates.iloc[-1]['Price'])
-                        standard.loc[standard['Day'] == day, 'Current Price'] = latest_price
-        
-        # Save the updated data
-        try:
-            with pd.ExcelWriter(self.master_file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                standard.to_excel(writer, sheet_name='Standard', index=False)
-            print("Successfully added Current Price column to Standard sheet")
-        except Exception as e:
-            raise IOError(f"Error saving updated data: {str(e)}")
+        logger.info("Successfully added Current Price column to Standard sheet")
     
     def add_capacity_allocation(self) -> None:
         """Add a column with current capacity allocation percentage to the Standard sheet.
@@ -199,11 +360,11 @@ class DataAnalyzer:
         This method:
         1. Extracts capacity allocation updates from the History sheet
         2. Updates the Standard sheet with the most recent allocation for each day
-        3. Saves the updated data back to the master file
+        
+        Call flush() afterwards to save the updated data back to the master file.
         
         Raises:
             ValueError: If required sheets are not found
-            IOError: If there's an error saving the updated data
         """
         history = self.get_sheet('History')
         standard = self.get_sheet('Standard')
@@ -211,30 +372,15 @@ class DataAnalyzer:
         if history is None or standard is None:
             raise ValueError("Required sheets not found")
         
-        # Initialize with default allocation
-        standard['Capacity Allocation %'] = round(float(config.DEFAULT_ALLOCATION), 2)
-        
         # Extract capacity updates
         capacity_updates = self._extract_capacity_updates(history)
         
-        if not capacity_updates.empty:
-            min_update_day = capacity_updates['Day'].min()
-            
-            # Update allocation for each day based on the most recent update
-            for day in sorted(standard['Day'].unique()):
-                if day >= min_update_day:
-                    applicable_updates = capacity_updates[capacity_updates['Day'] <= day]
-                    if not applicable_updates.empty:
-                        latest_allocation = round(float(applicable_updates.iloc[-1]['Allocation']), 2)
-                        standard.loc[standard['Day'] == day, 'Capacity Allocation %'] = latest_allocation
-        
-        # Save the updated data
-        try:
-            with pd.ExcelWriter(self.master_file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                standard.to_excel(writer, sheet_name='Standard', index=False)
-            print("Successfully added Capacity Allocation % column to Standard sheet")
-        except Exception as e:
-            raise IOError(f"Error saving updated data: {str(e)}")
+        # Carry the most recent allocation forward to every day
+        standard['Capacity Allocation %'] = self._latest_values(
+            standard, capacity_updates, 'Allocation', config.DEFAULT_ALLOCATION
+        ).astype(_UPDATE_DTYPES['Allocation']).round(2)
+        
+        logger.info("Successfully added Capacity Allocation % column to Standard sheet")
     
     def add_batch_sizes(self) -> None:
         """Add columns with initial and final batch sizes to the Standard sheet.
@@ -242,11 +388,11 @@ class DataAnalyzer:
         This method:
         1. Extracts batch size updates from the History sheet
         2. Updates the Standard sheet with the most recent batch sizes for each day
-        3. Saves the updated data back to the master file
+        
+        Call flush() afterwards to save the updated data back to the master file.
         
         Raises:
             ValueError: If required sheets are not found
-            IOError: If there's an error saving the updated data
         """
         history = self.get_sheet('History')
         standard = self.get_sheet('Standard')
@@ -254,41 +400,54 @@ class DataAnalyzer:
         if history is None or standard is None:
             raise ValueError("Required sheets not found")
         
-        # Initialize with default batch sizes
-        standard['Initial Batch Size'] = int(config.DEFAULT_INITIAL_BATCH_SIZE)
-        standard['Final Batch Size'] = int(config.DEFAULT_FINAL_BATCH_SIZE)
-        
         # Extract batch size updates
         initial_batch_updates = self._extract_initial_batch_size_updates(history)
         final_batch_updates = self._extract_final_batch_size_updates(history)
         
-        # Update initial batch sizes
-        if not initial_batch_updates.empty:
-            min_update_day = initial_batch_updates['Day'].min()
-            
-            for day in sorted(standard['Day'].unique()):
-                if day >= min_update_day:
-                    applicable_updates = initial_batch_updates[initial_batch_updates['Day'] <= day]
-                    if not applicable_updates.empty:
-                        latest_batch_size = int(applicable_updates.iloc[-1]['InitialBatchSize'])
-                        standard.loc[standard['Day'] == day, 'Initial Batch Size'] = latest_batch_size
-        
-        # Update final batch sizes
-        if not final_batch_updates.empty:
-            min_update_day = final_batch_updates['Day'].min()
-            
-            for day in sorted(standard['Day'].unique()):
-                if day >= min_update_day:
-                    applicable_updates = final_batch_updates[final_batch_updates['Day'] <= day]
-                    if not applicable_updates.empty:
-                        latest_batch_size = int(applicable_updates.iloc[-1]['FinalBatchSize'])
-                        standard.loc[standard['Day'] == day, 'Final Batch Size'] = latest_batch_size
-        
-        # Save the updated data
+        # Carry the most recent batch sizes forward to every day
+        standard['Initial Batch Size'] = self._latest_values(
+            standard, initial_batch_updates, 'InitialBatchSize', config.DEFAULT_INITIAL_BATCH_SIZE
+        ).astype(_UPDATE_DTYPES['InitialBatchSize'])
+        standard['Final Batch Size'] = self._latest_values(
+            standard, final_batch_updates, 'FinalBatchSize', config.DEFAULT_FINAL_BATCH_SIZE
+        ).astype(_UPDATE_DTYPES['FinalBatchSize'])
+        
+        logger.info("Successfully added Initial and Final Batch Size columns to Standard sheet")
+    
+    def flush(self) -> None:
+        """Save the updated data back to the master file.
+        
+        All add_* methods only update the in-memory data, so the workbook is
+        written a single time no matter how many columns were added, and not at
+        all if the derived columns are unchanged from the file. The whole
+        workbook is streamed out with xlsxwriter rather than patched in place
+        with openpyxl; header styles, column widths and blank header cells of
+        the existing master file are carried over.
+        
+        Raises:
+            ValueError: If no data is loaded or the Standard sheet is not found
+            IOError: If there's an error saving the updated data
+        """
+        if self.get_sheet('Standard') is None:
+            raise ValueError("Required sheets not found")
+        
+        # Skip the rewrite when the master file already holds these values
+        derived_columns = self._get_derived_columns()
+        if derived_columns is not None and derived_columns.equals(self._loaded_derived_columns):
+            logger.info("No changes to Standard sheet, master file not rewritten")
+            return
+        
         try:
-            with pd.ExcelWriter(self.master_file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                standard.to_excel(writer, sheet_name='Standard', index=False)
-            print("Successfully added Initial and Final Batch Size columns to Standard sheet")
+            formatting = read_header_formatting(self.master_file_path)
+            with pd.ExcelWriter(self.master_file_path, engine='xlsxwriter') as writer:
+                for sheet_name, df in self.data.items():
+                    # calamine reads blank header cells back as "Unnamed: N";
+                    # write them out blank again
+                    clean_column_names(df)
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+                    if sheet_name in formatting:
+                        apply_header_formatting(writer, sheet_name, df, *formatting[sheet_name])
+            logger.info("Successfully saved updated data to master file")
         except Exception as e:
             raise IOError(f"Error saving updated data: {str(e)}")
 
@@ -300,10 +459,12 @@ def main() -> None:
         analyzer.add_current_price()
         analyzer.add_capacity_allocation()
         analyzer.add_batch_sizes()
+        analyzer.flush()
     except Exception as e:
-        print(f"Error in analysis: {str(e)}")
+        logger.error("Error in analysis: %s", e)
         raise
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
     main() 
\ No newline at end of file
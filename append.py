@@ -5,23 +5,81 @@ This module provides functionality for consolidating Excel files into a master f
 """
 
 # Standard library imports
+import logging
 import os
 import re
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from copy import copy
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+from xml.etree.ElementTree import iterparse
 
 # Third-party imports
 import pandas as pd
 from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 from openpyxl.worksheet.worksheet import Worksheet
 
 # Local imports
 import config
 
 
-def copy_formatting(source_sheet: Worksheet, target_sheet: Worksheet) -> None:
+logger = logging.getLogger(__name__)
+
+# openpyxl border styles in xlsxwriter's border index order (index 0 is no border)
+_XLSXWRITER_BORDERS = [
+    'thin', 'medium', 'dashed', 'dotted', 'thick', 'double', 'hair', 'mediumDashed',
+    'dashDot', 'mediumDashDot', 'dashDotDot', 'mediumDashDotDot', 'slantDashDot',
+]
+
+# openpyxl underline styles mapped to xlsxwriter underline types
+_XLSXWRITER_UNDERLINES = {'single': 1, 'double': 2, 'singleAccounting': 33, 'doubleAccounting': 34}
+
+# openpyxl alignments that are named differently in xlsxwriter
+_XLSXWRITER_ALIGN = {'general': None, 'centerContinuous': 'center_across'}
+_XLSXWRITER_VALIGN = {'center': 'vcenter', 'justify': 'vjustify', 'distributed': 'vdistributed'}
+
+# Matches the day number in simulation export filenames, e.g. "... Day 42.xlsx"
+_DAY_RE = re.compile(r'Day (\d+)')
+
+
+def read_column_widths(source_sheet: ReadOnlyWorksheet) -> Dict[str, float]:
+    """Read column widths from a worksheet opened in read-only mode.
+    
+    Read-only worksheets don't expose column_dimensions, so the widths are
+    taken from the <cols> element, which comes before any cell data in the
+    sheet XML. Parsing stops as soon as the cell data starts.
+    
+    openpyxl has no public way to reach a read-only sheet's XML, so this uses
+    ReadOnlyWorksheet._get_source(), the same method its own row reader opens
+    the sheet with. Should a future openpyxl drop it, the widths are skipped
+    with a warning rather than failing the whole append.
+    
+    Args:
+        source_sheet: Read-only worksheet to read column widths from
+        
+    Returns:
+        Dict mapping column letters to their widths
+    """
+    widths = {}
+    get_source = getattr(source_sheet, '_get_source', None)
+    if get_source is None:
+        logger.warning("Can't read column widths of sheet '%s' with this openpyxl version",
+                       source_sheet.title)
+        return widths
+    with get_source() as source:
+        for _, element in iterparse(source, events=('start',)):
+            tag = element.tag.rpartition('}')[2]
+            if tag == 'sheetData':
+                break
+            if tag == 'col' and element.get('width') is not None:
+                widths[get_column_letter(int(element.get('min')))] = float(element.get('width'))
+    return widths
+
+
+def copy_formatting(source_sheet: ReadOnlyWorksheet, target_sheet: Worksheet) -> None:
     """Copy formatting from source sheet to target sheet.
     
     This includes:
@@ -33,70 +91,157 @@ def copy_formatting(source_sheet: Worksheet, target_sheet: Worksheet) -> None:
     - Number formats
     
     Args:
-        source_sheet: Worksheet to copy formatting from
+        source_sheet: Read-only worksheet to copy formatting from
         target_sheet: Worksheet to copy formatting to
     """
     # Copy exact column widths
-    for col in source_sheet.column_dimensions:
-        target_sheet.column_dimensions[col].width = source_sheet.column_dimensions[col].width
+    for col, width in read_column_widths(source_sheet).items():
+        target_sheet.column_dimensions[col].width = width
 
-    # Copy cell formatting from the header row only
-    for cell in next(source_sheet.iter_rows()):
-        if cell.has_style:
+    # Copy cell formatting from the header row only. Style objects are
+    # immutable, so shallow copies are enough. Blank, unstyled cells come back
+    # as EmptyCell in read-only mode, which has no style to copy.
+    for cell in next(source_sheet.iter_rows(min_row=1, max_row=1), ()):
+        if getattr(cell, 'has_style', False):
             target_cell = target_sheet.cell(row=1, column=cell.column)
-            
-            # Copy font
-            target_cell.font = Font(
-                name=cell.font.name,
-                size=cell.font.size,
-                bold=cell.font.bold,
-                italic=cell.font.italic,
-                vertAlign=cell.font.vertAlign,
-                underline=cell.font.underline,
-                strike=cell.font.strike,
-                color=cell.font.color
-            )
-            
-            # Copy fill
-            target_cell.fill = PatternFill(
-                start_color=cell.fill.start_color,
-                end_color=cell.fill.end_color,
-                fill_type=cell.fill.fill_type
-            )
-            
-            # Copy alignment
-            target_cell.alignment = Alignment(
-                horizontal=cell.alignment.horizontal,
-                vertical=cell.alignment.vertical,
-                text_rotation=cell.alignment.text_rotation,
-                wrap_text=cell.alignment.wrap_text,
-                shrink_to_fit=cell.alignment.shrink_to_fit,
-                indent=cell.alignment.indent
-            )
-            
-            # Copy borders
-            target_cell.border = Border(
-                left=Side(style=cell.border.left.style, color=cell.border.left.color),
-                right=Side(style=cell.border.right.style, color=cell.border.right.color),
-                top=Side(style=cell.border.top.style, color=cell.border.top.color),
-                bottom=Side(style=cell.border.bottom.style, color=cell.border.bottom.color)
-            )
-            
-            # Copy number format
+            target_cell.font = copy(cell.font)
+            target_cell.fill = copy(cell.fill)
+            target_cell.alignment = copy(cell.alignment)
+            target_cell.border = copy(cell.border)
             target_cell.number_format = cell.number_format
 
 
+def _color_to_hex(color: Any) -> Optional[str]:
+    """Convert an openpyxl color to an xlsxwriter '#RRGGBB' string.
+    
+    Args:
+        color: openpyxl Color object
+        
+    Returns:
+        The color as '#RRGGBB', or None for theme/indexed colors and unset colors
+    """
+    if color is None or color.type != 'rgb' or not isinstance(color.rgb, str):
+        return None
+    return f"#{color.rgb[-6:]}"
+
+
+def get_header_format(cell: Any) -> Dict[str, Any]:
+    """Translate the style of an openpyxl header cell into xlsxwriter format properties.
+    
+    This covers the same properties copy_formatting copies: font, fill,
+    alignment, borders and number format.
+    
+    Args:
+        cell: openpyxl cell to read the style from
+        
+    Returns:
+        Dict of xlsxwriter format properties
+    """
+    font, fill, alignment, border = cell.font, cell.fill, cell.alignment, cell.border
+    properties: Dict[str, Any] = {
+        'font_name': font.name,
+        'font_size': font.size,
+        'bold': bool(font.bold),
+        'italic': bool(font.italic),
+        'font_strikeout': bool(font.strike),
+        'font_color': _color_to_hex(font.color),
+        'align': _XLSXWRITER_ALIGN.get(alignment.horizontal, alignment.horizontal),
+        'valign': _XLSXWRITER_VALIGN.get(alignment.vertical, alignment.vertical),
+        'rotation': alignment.text_rotation or None,
+        'text_wrap': bool(alignment.wrap_text),
+        'shrink': bool(alignment.shrink_to_fit),
+        'indent': int(alignment.indent) or None,
+        'num_format': cell.number_format,
+    }
+    if font.underline:
+        properties['underline'] = _XLSXWRITER_UNDERLINES.get(font.underline, 1)
+    if font.vertAlign in ('superscript', 'subscript'):
+        properties['font_script'] = 1 if font.vertAlign == 'superscript' else 2
+    if fill.fill_type == 'solid':
+        properties['pattern'] = 1
+        properties['bg_color'] = _color_to_hex(fill.start_color)
+    for side in ('left', 'right', 'top', 'bottom'):
+        side_style = getattr(border, side)
+        if side_style is not None and side_style.style:
+            properties[side] = _XLSXWRITER_BORDERS.index(side_style.style) + 1
+            properties[f"{side}_color"] = _color_to_hex(side_style.color)
+    return {key: value for key, value in properties.items() if value is not None}
+
+
+def read_header_formatting(workbook_path: Union[str, Path]) -> Dict[str, Tuple[Dict[str, float], Dict[int, Dict[str, Any]]]]:
+    """Read column widths and header cell styles from every sheet of a workbook.
+    
+    Used to carry formatting over when a workbook is rewritten from scratch
+    with xlsxwriter, which cannot modify an existing file.
+    
+    Args:
+        workbook_path: Path to the workbook to read formatting from
+        
+    Returns:
+        Dict mapping sheet names to a tuple of column widths (by column letter)
+        and xlsxwriter header formats (by zero-based column index)
+    """
+    formatting = {}
+    with closing(load_workbook(workbook_path, read_only=True, keep_links=False)) as workbook:
+        for sheet in workbook.worksheets:
+            header_formats = {}
+            for cell in next(sheet.iter_rows(min_row=1, max_row=1), ()):
+                if getattr(cell, 'has_style', False):
+                    header_formats[cell.column - 1] = get_header_format(cell)
+            formatting[sheet.title] = (read_column_widths(sheet), header_formats)
+    return formatting
+
+
+def apply_header_formatting(writer: pd.ExcelWriter, sheet_name: str, df: pd.DataFrame,
+                            column_widths: Dict[str, float],
+                            header_formats: Dict[int, Dict[str, Any]]) -> None:
+    """Apply column widths and header styles to a sheet written with the xlsxwriter engine.
+    
+    Args:
+        writer: ExcelWriter using the xlsxwriter engine
+        sheet_name: Name of the sheet that df was written to
+        df: DataFrame that was written to the sheet (for the header values)
+        column_widths: Column widths by column letter, as from read_header_formatting
+        header_formats: xlsxwriter header formats by column index, as from read_header_formatting
+    """
+    worksheet = writer.sheets[sheet_name]
+    for col, width in column_widths.items():
+        # openpyxl widths already include cell padding, xlsxwriter's set_column
+        # widths don't; going through pixels (7 per character) keeps them equal
+        idx = column_index_from_string(col) - 1
+        worksheet.set_column_pixels(idx, idx, round(width * 7))
+    
+    for idx, properties in header_formats.items():
+        if idx < len(df.columns):
+            worksheet.write(0, idx, df.columns[idx], writer.book.add_format(properties))
+
+
 def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean column names by removing 'Unnamed:' prefixes.
+    """Clean column names in place by removing 'Unnamed:' prefixes.
     
     Args:
         df: DataFrame with columns to clean
         
     Returns:
-        DataFrame with cleaned column names
+        The same DataFrame, with cleaned column names
+    """
+    df.columns = ['' if isinstance(col, str) and col.startswith('Unnamed:') else col for col in df.columns]
+    return df
+
+
+def prepare_sheet(sheet_name: str, new_data: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """Prepare a sheet from the latest Excel file for writing to the master file.
+    
+    Args:
+        sheet_name: Name of the sheet
+        new_data: DataFrame read from the sheet
+        
+    Returns:
+        DataFrame with cleaned column names, or None if the sheet should be skipped
     """
-    new_columns = {col: '' if col.startswith('Unnamed:') else col for col in df.columns}
-    return df.rename(columns=new_columns)
+    if sheet_name.endswith('-Graphs'):
+        return None
+    return clean_column_names(new_data)
 
 
 def get_day_number(filename: Union[str, Path]) -> int:
@@ -108,7 +253,8 @@ def get_day_number(filename: Union[str, Path]) -> int:
     Returns:
         Day number as integer, or 0 if not found
     """
-    match = re.search(r'Day (\d+)', str(filename))
+    name = filename.name if isinstance(filename, Path) else str(filename)
+    match = _DAY_RE.search(name)
     return int(match.group(1)) if match else 0
 
 
@@ -124,15 +270,19 @@ def get_latest_excel_file() -> Optional[Path]:
     if not config.DATA_FOLDER_PATH.exists():
         raise FileNotFoundError(f"Data folder not found: {config.DATA_FOLDER_PATH}")
     
-    # Get all Excel files excluding master and temp files
-    excel_files = list(config.DATA_FOLDER_PATH.glob("*.xlsx"))
-    excel_files = [f for f in excel_files if f.name != "Master.xlsx" and not f.name.startswith("~$")]
+    # Find the Excel file with the highest day number in one directory scan,
+    # excluding master and temp files
+    latest_day, latest_file = -1, None
+    with os.scandir(config.DATA_FOLDER_PATH) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith(".xlsx") or name == "Master.xlsx" or name.startswith("~$"):
+                continue
+            day = get_day_number(name)
+            if day > latest_day:
+                latest_day, latest_file = day, Path(entry.path)
     
-    if not excel_files:
-        return None
-    
-    # Find latest file by day number in filename
-    return max(excel_files, key=get_day_number)
+    return latest_file
 
 
 def append_to_master() -> None:
@@ -149,38 +299,41 @@ def append_to_master() -> None:
         ValueError: If the latest file cannot be read
         IOError: If there's an error writing to the master file
     """
+    config.validate_paths()
+    
     # Get the latest Excel file
     latest_file = get_latest_excel_file()
     if latest_file is None:
         raise FileNotFoundError("No Excel files found in directory")
     
-    print(f"Processing latest file: {latest_file.name}")
+    logger.info("Processing latest file: %s", latest_file.name)
     
     try:
         # Read all sheets from the latest file
         new_data_dict = pd.read_excel(
             latest_file,
-            engine='openpyxl',
+            engine='calamine',
             sheet_name=None,
             keep_default_na=False,
             na_filter=False
         )
         
-        # Load the source workbook for formatting
-        source_wb = load_workbook(latest_file)
+        # Load the source workbook for formatting, streaming only the rows we touch
+        source_wb = load_workbook(latest_file, read_only=True, data_only=True, keep_links=False)
         
-        # Create or update master file
-        with pd.ExcelWriter(config.MASTER_FILE, engine='openpyxl') as writer:
-            for sheet_name, new_data in new_data_dict.items():
-                if sheet_name.endswith('-Graphs'):
-                    print(f"Skipping graph sheet '{sheet_name}'")
+        # Create or update master file. Sheets are prepared in a thread pool so
+        # the next sheet is cleaned while the current one is written; the
+        # writer itself stays on this thread since openpyxl isn't thread-safe.
+        with closing(source_wb), ThreadPoolExecutor() as pool, \
+                pd.ExcelWriter(config.MASTER_FILE, engine='openpyxl') as writer:
+            prepared_sheets = pool.map(prepare_sheet, new_data_dict.keys(), new_data_dict.values())
+            for sheet_name, new_data in zip(new_data_dict.keys(), prepared_sheets):
+                if new_data is None:
+                    logger.info("Skipping graph sheet '%s'", sheet_name)
                     continue
                 
-                print(f"\nProcessing sheet: {sheet_name}")
-                print(f"New data rows: {len(new_data)}")
-                
-                # Clean the column names
-                new_data = clean_column_names(new_data)
+                logger.info("Processing sheet: %s", sheet_name)
+                logger.info("New data rows: %s", len(new_data))
                 
                 # Write the new data to Excel
                 new_data.to_excel(writer, sheet_name=sheet_name, index=False)
@@ -191,12 +344,10 @@ def append_to_master() -> None:
                     target_sheet = writer.sheets[sheet_name]
                     copy_formatting(source_sheet, target_sheet)
         
-        print("\nMaster file updated successfully!")
+        logger.info("Master file updated successfully!")
         
     except Exception as e:
-        print(f"Error processing file: {str(e)}")
-        print("Error details:")
-        print(traceback.format_exc())
+        logger.exception("Error processing file: %s", e)
         raise
 
 
@@ -205,9 +356,10 @@ def main() -> None:
     try:
         append_to_master()
     except Exception as e:
-        print(f"Error in append: {str(e)}")
+        logger.error("Error in append: %s", e)
         raise
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
     main()
@@ -5,6 +5,8 @@ This module contains all configuration settings for data processing and Google D
 """
 
 # Standard library imports
+import functools
+import logging
 import os
 import json
 from pathlib import Path
@@ -13,9 +15,17 @@ from typing import Optional, Dict, Any
 # Third-party imports
 from dotenv import load_dotenv
 
+# orjson is used for the config store when installed; stdlib json otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Constants
 # ---------
 
@@ -36,20 +46,37 @@ USER_EMAIL = os.environ.get("OPS_SIM_USER_EMAIL", "")
 # Google Sheets configuration
 SHEET_NAME = "Master"
 SHEET_ID = os.environ.get("OPS_SIM_SHEET_ID", "")
+SHEETS_CELLS_PER_REQUEST = 100000  # Larger uploads are split into several write requests
+SHEETS_MAX_WORKERS = 5  # Write requests sent concurrently
+SHEETS_WRITE_QUOTA_PER_MIN = 60  # Sheets API write requests allowed per minute per user
+# Sheets request bodies are only sent gzip-compressed when enabled, as Google
+# only documents gzip support for responses
+SHEETS_GZIP_REQUESTS = os.environ.get("OPS_SIM_SHEETS_GZIP", "").lower() in ("1", "true", "yes")
+SHEETS_GZIP_MIN_BYTES = 4096  # Smallest request body that is compressed when enabled
+GDRIVE_RESUMABLE_THRESHOLD = 5 * 1024 * 1024  # Smaller files are uploaded in a single request
+GDRIVE_UPLOAD_CHUNKSIZE = 8 * 1024 * 1024  # Chunk size for resumable uploads
 
 # File paths configuration
 MASTER_FILE = DATA_FOLDER_PATH / "Master.xlsx"
 CREDENTIALS_FILE = Path("credentials.json")
 CLIENT_SECRET_FILE = Path("client_secret.json")  # Optional
-TOKEN_PICKLE_FILE = Path("token.pickle")
+TOKEN_JSON_FILE = Path("token.json")
 CONFIG_STORE_FILE = Path("config_store.json")
 
-# Print data path for debugging
-print(f"Using data folder path: {DATA_FOLDER_PATH}")
+# Log line format used by the command-line entry points
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
 
+# In-memory copy of the config store and the modification time it was read at
+_config_store_cache: Optional[Dict[str, Any]] = None
+_config_store_mtime: float = 0.0
+
+@functools.lru_cache(maxsize=1)
 def validate_paths() -> None:
     """Validate that required paths exist and are accessible.
     
+    The checks run once per process; modules call this before their first
+    disk access rather than on import.
+    
     Raises:
         FileNotFoundError: If any required file or directory is missing
         PermissionError: If any required file or directory is not accessible
@@ -59,7 +86,7 @@ def validate_paths() -> None:
         try:
             # Try to create the data folder if it doesn't exist
             DATA_FOLDER_PATH.mkdir(parents=True, exist_ok=True)
-            print(f"Created data folder: {DATA_FOLDER_PATH}")
+            logger.info("Created data folder: %s", DATA_FOLDER_PATH)
         except Exception as e:
             raise FileNotFoundError(f"Could not create data folder: {DATA_FOLDER_PATH}. Error: {str(e)}")
     
@@ -70,9 +97,9 @@ def validate_paths() -> None:
     # Note: We only check this if we're actually going to use Google APIs
     if (GDRIVE_FOLDER_ID or SHEET_ID) and not (
             CREDENTIALS_FILE.exists() or CLIENT_SECRET_FILE.exists()):
-        print(f"Warning: No authentication files found. You will need to create either "
-              f"{CREDENTIALS_FILE} (service account) or {CLIENT_SECRET_FILE} (OAuth) "
-              f"to use Google API functionality.")
+        logger.warning("No authentication files found. You will need to create either "
+                       "%s (service account) or %s (OAuth) "
+                       "to use Google API functionality.", CREDENTIALS_FILE, CLIENT_SECRET_FILE)
     
     # If credentials.json exists, make sure it's readable
     if CREDENTIALS_FILE.exists() and not os.access(CREDENTIALS_FILE, os.R_OK):
@@ -82,6 +109,9 @@ def validate_paths() -> None:
 def load_config_store() -> Dict[str, Any]:
     """Load persistent configuration from the config store file.
     
+    The parsed file is kept in memory and only re-read when its modification
+    time changes.
+    
     Returns:
         Dict containing the stored configuration values.
         
@@ -89,30 +119,53 @@ def load_config_store() -> Dict[str, Any]:
         FileNotFoundError: If the config store file doesn't exist
         json.JSONDecodeError: If the config store file is not valid JSON
     """
-    if not CONFIG_STORE_FILE.exists():
-        return {}
+    global _config_store_cache, _config_store_mtime
     
     try:
-        with open(CONFIG_STORE_FILE, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError as e:
-        raise json.JSONDecodeError(f"Invalid JSON in config store file: {e}", e.doc, e.pos)
+        mtime = CONFIG_STORE_FILE.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+    
+    # Only re-parse the file if it changed since it was last read
+    if _config_store_cache is None or mtime != _config_store_mtime:
+        try:
+            raw = CONFIG_STORE_FILE.read_bytes()
+            _config_store_cache = orjson.loads(raw) if orjson else json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Invalid JSON in config store file: {e}", e.doc, e.pos)
+        _config_store_mtime = mtime
+    
+    return dict(_config_store_cache)
 
 
 def save_config_store(config_data: Dict[str, Any]) -> None:
     """Save configuration to the config store file.
     
+    The file is written to a temporary file first and then moved into place,
+    so an interrupted save cannot leave a truncated store. The in-memory copy
+    is only updated once the write succeeded.
+    
     Args:
         config_data: Dictionary containing configuration values to save.
         
     Raises:
         PermissionError: If the config store file is not writable
     """
+    global _config_store_cache, _config_store_mtime
+    
+    tmp_file = CONFIG_STORE_FILE.with_name(CONFIG_STORE_FILE.name + '.tmp')
     try:
-        with open(CONFIG_STORE_FILE, 'w') as f:
-            json.dump(config_data, f, indent=4)
+        if orjson:
+            tmp_file.write_bytes(orjson.dumps(config_data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_file, 'w') as f:
+                json.dump(config_data, f, indent=4)
+        os.replace(tmp_file, CONFIG_STORE_FILE)
     except PermissionError:
         raise PermissionError(f"Config store file not writable: {CONFIG_STORE_FILE}")
+    
+    _config_store_cache = dict(config_data)
+    _config_store_mtime = CONFIG_STORE_FILE.stat().st_mtime
 
 
 def get_sheet_id() -> Optional[str]:
@@ -134,7 +187,3 @@ def save_sheet_id(sheet_id: str) -> None:
     config_data = load_config_store()
     config_data['SHEET_ID'] = sheet_id
     save_config_store(config_data)
-
-
-# Validate paths on module import
-validate_paths()
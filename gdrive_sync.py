@@ -5,26 +5,57 @@ This module provides functionality for syncing Excel files with Google Drive and
 """
 
 # Standard library imports
+import functools
+import gzip
 import json
+import logging
 import os
-import pickle
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple, List, Union
+from typing import Optional, BinaryIO, Deque, Dict, Any, Tuple, List, Union
 
 # Third-party imports
-import gspread
+import httplib2
 import numpy as np
 import pandas as pd
 from google.oauth2 import service_account
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaInMemoryUpload, MediaIoBaseUpload
+from googleapiclient.model import JsonModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson is used for Sheets request bodies when installed; stdlib json otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Local imports
 import config
 
 
+logger = logging.getLogger(__name__)
+
+# HTTP statuses of transient errors that are worth retrying
+_RETRY_STATUSES = (429, 500, 503)
+
+# Inferred dtypes of object columns whose values can be sent to Sheets as-is
+_JSON_SAFE_TYPES = {'empty', 'string', 'integer', 'floating', 'mixed-integer-float', 'boolean'}
+
+# Credentials loaded in this run and the token file modification time they match
+_cached_creds: Optional[Any] = None
+_cached_creds_mtime: Optional[float] = None
+_creds_lock = threading.Lock()
+
 # Define the scopes
 SCOPES = [
     'https://www.googleapis.com/auth/drive',
@@ -35,6 +66,9 @@ SCOPES = [
 def save_sheet_id(sheet_id: str) -> None:
     """Save the Google Sheet ID to the config module and to a persistent file.
     
+    The store is only rewritten if the ID changed; config.save_config_store
+    writes it atomically.
+    
     Args:
         sheet_id: The ID of the Google Sheet
         
@@ -46,17 +80,14 @@ def save_sheet_id(sheet_id: str) -> None:
         config.SHEET_ID = sheet_id
         
         # Save to the persistent store
-        config_data = {}
-        if os.path.exists(config.CONFIG_STORE_FILE):
-            with open(config.CONFIG_STORE_FILE, 'r') as f:
-                config_data = json.load(f)
+        config_data = config.load_config_store()
+        if config_data.get('SHEET_ID') == sheet_id:
+            return
         
         config_data['SHEET_ID'] = sheet_id
+        config.save_config_store(config_data)
         
-        with open(config.CONFIG_STORE_FILE, 'w') as f:
-            json.dump(config_data, f, indent=2)
-        
-        print(f"Saved Google Sheet ID: {sheet_id} to config")
+        logger.info("Saved Google Sheet ID: %s to config", sheet_id)
     except Exception as e:
         raise IOError(f"Could not save Sheet ID to persistent store: {str(e)}")
 
@@ -64,27 +95,64 @@ def save_sheet_id(sheet_id: str) -> None:
 def load_saved_config() -> None:
     """Load saved configuration from the persistent store.
     
+    Does nothing if a Sheet ID is already configured.
+    
     Raises:
         IOError: If there's an error loading the configuration
     """
+    if config.SHEET_ID:
+        return
+    
     try:
-        if os.path.exists(config.CONFIG_STORE_FILE):
-            with open(config.CONFIG_STORE_FILE, 'r') as f:
-                config_data = json.load(f)
-            
-            if 'SHEET_ID' in config_data and config_data['SHEET_ID'] and not config.SHEET_ID:
-                config.SHEET_ID = config_data['SHEET_ID']
-                print(f"Loaded saved Sheet ID: {config.SHEET_ID}")
+        config_data = config.load_config_store()
+        if config_data.get('SHEET_ID'):
+            config.SHEET_ID = config_data['SHEET_ID']
+            logger.info("Loaded saved Sheet ID: %s", config.SHEET_ID)
     except Exception as e:
         raise IOError(f"Could not load from persistent store: {str(e)}")
 
 
+def _token_mtime() -> Optional[float]:
+    """Get the modification time of the token file.
+    
+    Returns:
+        The modification time, or None if the token file doesn't exist
+    """
+    try:
+        return os.path.getmtime(config.TOKEN_JSON_FILE)
+    except OSError:
+        return None
+
+
 def get_credentials() -> Optional[Any]:
     """Get valid user credentials for Google API access.
     
-    First tries to load credentials from token.pickle file.
-    If that doesn't work, it will either refresh the token or
-    initiate the OAuth2 flow.
+    Credentials are kept in memory until they expire, so repeated calls in
+    one run return the same object without touching the token file again
+    (unless it changed on disk). Service account credentials have no token
+    until their first request and never count as expired, so they are kept
+    for the whole run; the HTTP clients fetch and renew their tokens.
+    Otherwise tries to load credentials from token.json file. If that
+    doesn't work, it will either refresh the token or initiate the OAuth2
+    flow, and only then write token.json. Service account credentials are
+    never written to token.json; they are loaded from credentials.json on
+    every run.
+    
+    Calls from several threads are serialized, so concurrent callers share
+    one set of credentials instead of each loading their own.
+    
+    Returns:
+        Credentials object, or None if authentication fails
+        
+    Raises:
+        IOError: If there's an error with authentication
+    """
+    with _creds_lock:
+        return _load_credentials()
+
+
+def _load_credentials() -> Optional[Any]:
+    """Get the cached credentials, or load them as described in get_credentials().
     
     Returns:
         Credentials object, or None if authentication fails
@@ -92,93 +160,468 @@ def get_credentials() -> Optional[Any]:
     Raises:
         IOError: If there's an error with authentication
     """
+    global _cached_creds, _cached_creds_mtime
+    
+    token_mtime = _token_mtime()
+    if _cached_creds is not None and not _cached_creds.expired and token_mtime == _cached_creds_mtime:
+        return _cached_creds
+    
     creds = None
     
-    # Check if token.pickle exists
-    if os.path.exists(config.TOKEN_PICKLE_FILE):
-        with open(config.TOKEN_PICKLE_FILE, 'rb') as token:
-            creds = pickle.load(token)
+    # Check if token.json exists
+    if token_mtime is not None:
+        with open(config.TOKEN_JSON_FILE, 'r') as token:
+            creds = Credentials.from_authorized_user_info(json.load(token), SCOPES)
+    
+    # Valid stored credentials need neither a refresh nor a rewrite
+    if creds and creds.valid:
+        _cached_creds, _cached_creds_mtime = creds, token_mtime
+        return creds
     
     # If there are no (valid) credentials, let the user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            try:
-                # Try to use service account if credentials.json exists
-                if os.path.exists(config.CREDENTIALS_FILE):
-                    creds = service_account.Credentials.from_service_account_file(
-                        config.CREDENTIALS_FILE, scopes=SCOPES)
-                elif os.path.exists(config.CLIENT_SECRET_FILE):
-                    # Use OAuth flow if client_secret.json exists
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        config.CLIENT_SECRET_FILE, SCOPES)
-                    creds = flow.run_local_server(port=0)
-                else:
-                    raise IOError(
-                        "No authentication files found. Need either "
-                        f"{config.CREDENTIALS_FILE} (service account) or "
-                        f"{config.CLIENT_SECRET_FILE} (OAuth)"
-                    )
-            except Exception as e:
+    if creds and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+    else:
+        try:
+            # Try to use service account if credentials.json exists
+            if os.path.exists(config.CREDENTIALS_FILE):
+                creds = service_account.Credentials.from_service_account_file(
+                    config.CREDENTIALS_FILE, scopes=SCOPES)
+            elif os.path.exists(config.CLIENT_SECRET_FILE):
+                # Use OAuth flow if client_secret.json exists (only needed on first login)
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    config.CLIENT_SECRET_FILE, SCOPES)
+                creds = flow.run_local_server(port=0)
+            else:
                 raise IOError(
-                    f"Error with authentication: {str(e)}\n"
-                    f"Please make sure you have either a {config.CREDENTIALS_FILE} "
-                    f"(service account) or {config.CLIENT_SECRET_FILE} file."
+                    "No authentication files found. Need either "
+                    f"{config.CREDENTIALS_FILE} (service account) or "
+                    f"{config.CLIENT_SECRET_FILE} (OAuth)"
                 )
-        
-        # Save the credentials for the next run
-        with open(config.TOKEN_PICKLE_FILE, 'wb') as token:
-            pickle.dump(creds, token)
+        except Exception as e:
+            raise IOError(
+                f"Error with authentication: {str(e)}\n"
+                f"Please make sure you have either a {config.CREDENTIALS_FILE} "
+                f"(service account) or {config.CLIENT_SECRET_FILE} file."
+            )
+    
+    # Save user credentials for the next run
+    if isinstance(creds, Credentials):
+        with open(config.TOKEN_JSON_FILE, 'w') as token:
+            token.write(creds.to_json())
     
+    _cached_creds, _cached_creds_mtime = creds, _token_mtime()
     return creds
 
 
+@functools.lru_cache(maxsize=16)
+def _authorized_http(creds: Any, thread_id: int) -> AuthorizedHttp:
+    """Get the authorized HTTP object shared by the Drive and Sheets clients of a thread.
+    
+    httplib2 keeps one open connection per host, so sharing it means the
+    Google API clients reuse their TLS connections for the whole run. It
+    isn't thread-safe though, so every thread gets its own.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        thread_id: Identifier of the thread that uses the HTTP object
+        
+    Returns:
+        Authorized httplib2 HTTP object
+    """
+    return AuthorizedHttp(creds, http=httplib2.Http())
+
+
+@functools.lru_cache(maxsize=1)
+def _authorized_session(creds: Any) -> AuthorizedSession:
+    """Get the authorized requests session used by gspread.
+    
+    The session pools its connections and retries transient errors itself.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        
+    Returns:
+        Authorized requests session
+    """
+    session = AuthorizedSession(creds)
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=_RETRY_STATUSES)
+    )
+    session.mount('https://', adapter)
+    return session
+
+
+def _drive_service(creds: Any) -> Any:
+    """Get a Drive API client for the given credentials.
+    
+    The client is cached per credentials object and thread, so every call in
+    a run reuses one discovery document and the thread's authorized HTTP
+    connection, and threads can use the API at the same time.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        
+    Returns:
+        Drive v3 service object
+    """
+    return _build_drive_service(creds, threading.get_ident())
+
+
+@functools.lru_cache(maxsize=16)
+def _build_drive_service(creds: Any, thread_id: int) -> Any:
+    return build('drive', 'v3', http=_authorized_http(creds, thread_id))
+
+
+class _SheetsJsonModel(JsonModel):
+    """JsonModel for Sheets requests.
+    
+    Bodies are serialized with orjson when it is installed, which is much
+    faster for large payloads. With config.SHEETS_GZIP_REQUESTS enabled,
+    bodies are also gzip-compressed once they reach config.SHEETS_GZIP_MIN_BYTES.
+    """
+    
+    def serialize(self, body_value: Any) -> str:
+        if orjson is None:
+            return super().serialize(body_value)
+        if isinstance(body_value, dict) and 'data' not in body_value and self._data_wrapper:
+            body_value = {'data': body_value}
+        return orjson.dumps(body_value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    def request(self, headers: Dict[str, str], path_params: Dict[str, Any],
+                query_params: Dict[str, Any], body_value: Any,
+                api_version: Optional[str] = None) -> Tuple[Dict[str, str], Dict[str, Any], str, Any]:
+        headers, path_params, query, body = super().request(
+            headers, path_params, query_params, body_value, api_version)
+        if (config.SHEETS_GZIP_REQUESTS and body is not None
+                and len(body) >= config.SHEETS_GZIP_MIN_BYTES):
+            body = gzip.compress(body.encode('utf-8'), compresslevel=6)
+            headers['content-encoding'] = 'gzip'
+        return headers, path_params, query, body
+
+
+def _sheets_service(creds: Any) -> Any:
+    """Get a Sheets API client for the given credentials, cached like _drive_service.
+    
+    Request bodies are serialized (and optionally compressed) by _SheetsJsonModel.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        
+    Returns:
+        Sheets v4 service object
+    """
+    return _build_sheets_service(creds, threading.get_ident())
+
+
+@functools.lru_cache(maxsize=16)
+def _build_sheets_service(creds: Any, thread_id: int) -> Any:
+    return build('sheets', 'v4', http=_authorized_http(creds, thread_id), model=_SheetsJsonModel())
+
+
+@functools.lru_cache(maxsize=1)
+def _gspread_client(creds: Any) -> Any:
+    """Get a gspread client for the given credentials, cached like _drive_service.
+    
+    The client sends its requests through the pooled _authorized_session.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        
+    Returns:
+        Authorized gspread client
+    """
+    import gspread  # Imported here as only update_google_sheet needs it
+    
+    return gspread.authorize(creds, session=_authorized_session(creds))
+
+
+@functools.lru_cache(maxsize=8)
+def _folder_metadata(creds: Any, folder_id: str) -> Dict[str, Any]:
+    """Get the ID, name and MIME type of a Drive folder.
+    
+    The metadata is cached per credentials and folder ID, so the folder is
+    only looked up once per run.
+    
+    Args:
+        creds: Google API credentials
+        folder_id: ID of the Drive folder
+        
+    Returns:
+        Dict with the folder's id, name and mimeType
+    """
+    return retry_execute(_drive_service(creds).files().get(
+        fileId=folder_id,
+        fields='id, name, mimeType'
+    ))
+
+
 def _clean_dataframe(df: pd.DataFrame) -> List[List[Any]]:
     """Clean a DataFrame for Google Sheets upload.
     
+    Numbers are kept as numbers, missing and infinite values become empty
+    strings and everything else is converted to a string. Columns are
+    classified once by dtype, then the frame is converted to a single object
+    array that is masked and converted in place.
+    
     Args:
         df: DataFrame to clean
         
     Returns:
         List of lists representing the cleaned data
     """
-    # Replace NaN values with empty strings
-    df = df.fillna('')
+    # Classify the columns once from their dtypes
+    float_columns, object_columns, text_columns = [], [], []
+    for i, dtype in enumerate(df.dtypes):
+        if pd.api.types.is_float_dtype(dtype):
+            float_columns.append(i)
+        elif pd.api.types.is_object_dtype(dtype):
+            object_columns.append(i)
+        elif not pd.api.types.is_numeric_dtype(dtype):
+            text_columns.append(i)
     
-    # Convert DataFrame to list of lists
-    values = [df.columns.tolist()]  # First row is headers
+    # Object dtype turns NumPy scalars into plain Python values
+    arr = df.to_numpy(dtype=object, copy=True)
+    missing = pd.isna(arr)
     
-    # Convert all values to strings if they're not already
-    rows_data = []
-    for _, row in df.iterrows():
-        row_data = []
-        for val in row:
-            if pd.isna(val):  # Double-check for NaN/None values
-                row_data.append('')
-            elif isinstance(val, (int, float)):
-                # For numbers, make sure they're within JSON range
-                if np.isnan(val) or np.isinf(val):
-                    row_data.append('')
-                else:
-                    row_data.append(val)
-            else:
-                # Convert to string for everything else
-                row_data.append(str(val))
-        rows_data.append(row_data)
+    if float_columns:
+        # Infinite values aren't valid JSON, treat them as missing
+        floats = df.iloc[:, float_columns].to_numpy(dtype=float, na_value=np.nan)
+        missing[:, float_columns] |= np.isinf(floats)
+    
+    for i in object_columns:
+        missing[:, i] |= (arr[:, i] == np.inf) | (arr[:, i] == -np.inf)
+        if pd.api.types.infer_dtype(arr[:, i], skipna=True) not in _JSON_SAFE_TYPES:
+            # Mixed columns may hold values JSON can't encode, convert those
+            arr[:, i] = [val if isinstance(val, (str, int, float)) else str(val) for val in arr[:, i]]
     
-    values.extend(rows_data)
+    for i in text_columns:
+        # Dates, categories, etc. are sent as their string form
+        arr[:, i] = df.iloc[:, i].map(str, na_action='ignore').to_numpy(dtype=object)
+    
+    arr[missing] = ''
+    
+    values = [df.columns.tolist()]  # First row is headers
+    values.extend(arr.tolist())
     return values
 
 
-def update_google_sheet(file_path: Union[str, Path], sheet_id: Optional[str] = None,
-                       sheet_name: Optional[str] = None) -> Optional[str]:
+def _read_excel_sheets(file_path: Union[str, Path, BinaryIO]) -> Dict[str, pd.DataFrame]:
+    """Read all sheets of an Excel file, except graph sheets.
+    
+    Uses the Rust-backed calamine engine, falling back to openpyxl (which
+    pandas opens in read-only mode) if python-calamine isn't installed.
+    Sheets whose name ends in '-Graphs' are skipped without being parsed.
+    
+    Args:
+        file_path: Path to the Excel file, or a binary stream with its contents
+        
+    Returns:
+        Dict mapping sheet names to their data
+    """
+    try:
+        excel_file = pd.ExcelFile(file_path, engine='calamine')
+    except ImportError:
+        excel_file = pd.ExcelFile(file_path, engine='openpyxl')
+    
+    with excel_file:
+        excel_data = {}
+        for ws_name in excel_file.sheet_names:
+            if ws_name.endswith('-Graphs'):
+                logger.info("Skipping graph sheet '%s'", ws_name)
+                continue
+            excel_data[ws_name] = excel_file.parse(ws_name)
+        return excel_data
+
+
+def _sheet_range(sheet_name: str, row: int = 1) -> str:
+    """Build the A1 notation range starting at column A of a worksheet row.
+    
+    Args:
+        sheet_name: Title of the worksheet
+        row: 1-based row the range starts at
+        
+    Returns:
+        The range, with the title quoted as the Sheets API requires
+    """
+    escaped_name = sheet_name.replace("'", "''")
+    return f"'{escaped_name}'!A{row}"
+
+
+class _RateLimiter:
+    """Blocks callers so that at most `limit` calls start within any `period` seconds."""
+    
+    def __init__(self, limit: int, period: float = 60.0) -> None:
+        self.limit = limit
+        self.period = period
+        self._calls: Deque[float] = deque()
+        self._lock = threading.Lock()
+    
+    def wait(self) -> None:
+        """Wait until another call is allowed and record it."""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.limit:
+                    self._calls.append(now)
+                    return
+                time.sleep(self.period - (now - self._calls[0]))
+
+
+# Shared by all threads writing to Google Sheets
+_sheets_write_limiter = _RateLimiter(config.SHEETS_WRITE_QUOTA_PER_MIN)
+
+
+def retry_execute(request: Any, http: Optional[Any] = None, max_tries: int = 6) -> Any:
+    """Execute a Google API request, retrying with exponential backoff on transient errors.
+    
+    Rate limiting (429) and server errors (500, 503) are retried after
+    waiting 1, 2, 4, ... seconds plus random jitter.
+    
+    Args:
+        request: googleapiclient HttpRequest or BatchHttpRequest to execute
+        http: HTTP object to execute the request with (defaults to the service's own)
+        max_tries: Maximum number of attempts
+        
+    Returns:
+        The response of the request
+        
+    Raises:
+        HttpError: If the request fails for another reason or keeps failing
+    """
+    for attempt in range(max_tries):
+        try:
+            return request.execute(http=http)
+        except HttpError as e:
+            if e.resp.status not in _RETRY_STATUSES or attempt == max_tries - 1:
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+
+def _split_value_ranges(sheet_values: Dict[str, List[List[Any]]],
+                        max_cells: int) -> List[List[Dict[str, Any]]]:
+    """Split worksheet data into batches of value ranges of at most max_cells cells each.
+    
+    Worksheets larger than max_cells are split into several row ranges.
+    
+    Args:
+        sheet_values: Cleaned data of each worksheet, by worksheet title
+        max_cells: Maximum number of cells per batch
+        
+    Returns:
+        List of batches, each a list of value ranges for values.batchUpdate
+    """
+    batches: List[List[Dict[str, Any]]] = []
+    batch: List[Dict[str, Any]] = []
+    batch_cells = 0
+    for sheet_name, values in sheet_values.items():
+        columns = max(len(values[0]), 1)
+        rows_per_range = max(max_cells // columns, 1)
+        for start in range(0, len(values), rows_per_range):
+            rows = values[start:start + rows_per_range]
+            cells = len(rows) * columns
+            if batch and batch_cells + cells > max_cells:
+                batches.append(batch)
+                batch, batch_cells = [], 0
+            batch.append({'range': _sheet_range(sheet_name, start + 1), 'values': rows})
+            batch_cells += cells
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _write_sheet_values(creds: Any, sheets_service: Any, sheet_id: str,
+                        sheet_values: Dict[str, List[List[Any]]]) -> None:
+    """Write the data of all worksheets to a Google Sheet.
+    
+    Usually this is a single values.batchUpdate request. Very large uploads
+    are split into several requests that are sent concurrently, within the
+    Sheets write quota, each thread using its own HTTP connection since
+    httplib2 isn't thread-safe.
+    
+    Args:
+        creds: Credentials object from get_credentials()
+        sheets_service: Sheets v4 service object
+        sheet_id: ID of the Google Sheet to write to
+        sheet_values: Cleaned data of each worksheet, by worksheet title
+    """
+    batches = _split_value_ranges(sheet_values, config.SHEETS_CELLS_PER_REQUEST)
+    
+    def write_batch(batch: List[Dict[str, Any]], http: Optional[Any] = None) -> None:
+        _sheets_write_limiter.wait()
+        request = sheets_service.spreadsheets().values().batchUpdate(
+            spreadsheetId=sheet_id,
+            body={'valueInputOption': 'RAW', 'data': batch}
+        )
+        retry_execute(request, http=http)
+    
+    if len(batches) == 1:
+        write_batch(batches[0])
+        return
+    
+    def write_batch_in_thread(batch: List[Dict[str, Any]]) -> None:
+        write_batch(batch, _authorized_http(creds, threading.get_ident()))
+    
+    logger.info("Writing data in %s requests", len(batches))
+    with ThreadPoolExecutor(max_workers=config.SHEETS_MAX_WORKERS) as pool:
+        list(pool.map(write_batch_in_thread, batches))
+
+
+def share_with_users(creds: Any, file_ids: List[str]) -> None:
+    """Give the configured users write access to Drive files.
+    
+    All permission grants are sent as one batch request. A failed grant is
+    reported as a warning and does not stop the others.
+    
+    Args:
+        creds: Google API credentials
+        file_ids: IDs of the files to share
+    """
+    emails = [email.strip() for email in config.USER_EMAIL.split(',') if email.strip()]
+    if not emails or not file_ids:
+        return
+    
+    drive_service = _drive_service(creds)
+    grants = [(file_id, email) for file_id in file_ids for email in emails]
+    
+    def report_permission(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+        file_id, email = grants[int(request_id)]
+        if exception is not None:
+            logger.warning("Could not share %s with %s: %s", file_id, email, exception)
+        else:
+            logger.info("Shared %s with %s", file_id, email)
+    
+    batch = drive_service.new_batch_http_request(callback=report_permission)
+    for i, (file_id, email) in enumerate(grants):
+        batch.add(
+            drive_service.permissions().create(
+                fileId=file_id,
+                body={'type': 'user', 'role': 'writer', 'emailAddress': email},
+                fields='id'
+            ),
+            request_id=str(i)
+        )
+    
+    try:
+        retry_execute(batch)
+    except Exception as e:
+        logger.warning("Could not share with user: %s", e)
+
+
+def update_google_sheet(file_path: Union[str, Path, BinaryIO], sheet_id: Optional[str] = None,
+                       sheet_name: Optional[str] = None, share: bool = True) -> Optional[str]:
     """Updates or creates a Google Sheet with data from an Excel file.
     
     Args:
-        file_path: Path to the Excel file
+        file_path: Path to the Excel file, or a binary stream with its contents
         sheet_id: ID of the Google Sheet to update (if None, creates a new sheet)
         sheet_name: Name of the sheet file in Google Drive
+        share: Whether to share the sheet with the configured users (default: True)
         
     Returns:
         The ID of the created or updated Google Sheet, or None if failed
@@ -196,117 +639,113 @@ def update_google_sheet(file_path: Union[str, Path], sheet_id: Optional[str] = N
         sheet_name = config.SHEET_NAME
     
     # Connect to Google Sheets API
-    gc = gspread.authorize(creds)
+    gc = _gspread_client(creds)
     
     try:
-        # Load all sheets from the Excel file
-        excel_data = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
+        # Load all sheets from the Excel file, except graph sheets
+        excel_data = _read_excel_sheets(file_path)
         
         if sheet_id:
             # Open existing spreadsheet
             try:
                 spreadsheet = gc.open_by_key(sheet_id)
-                print(f"Updating existing Google Sheet: {spreadsheet.title}")
+                logger.info("Updating existing Google Sheet: %s", spreadsheet.title)
             except Exception as e:
-                print(f"Error opening Google Sheet: {str(e)}")
-                print("Creating a new spreadsheet instead.")
+                logger.warning("Error opening Google Sheet: %s", e)
+                logger.info("Creating a new spreadsheet instead.")
                 spreadsheet = gc.create(sheet_name)
                 sheet_id = spreadsheet.id
         else:
             # Create new spreadsheet
             spreadsheet = gc.create(sheet_name)
             sheet_id = spreadsheet.id
-            print(f"Created new Google Sheet with ID: {sheet_id}")
+            logger.info("Created new Google Sheet with ID: %s", sheet_id)
             
             # Move the new spreadsheet to the configured folder
             if config.GDRIVE_FOLDER_ID:
-                drive_service = build('drive', 'v3', credentials=creds)
+                drive_service = _drive_service(creds)
                 try:
                     # First verify folder exists
-                    folder = drive_service.files().get(
-                        fileId=config.GDRIVE_FOLDER_ID,
-                        fields='id, name, mimeType'
-                    ).execute()
+                    folder = _folder_metadata(creds, config.GDRIVE_FOLDER_ID)
                     
                     if folder.get('mimeType') == 'application/vnd.google-apps.folder':
                         # Move the file to the folder
-                        drive_service.files().update(
+                        retry_execute(drive_service.files().update(
                             fileId=sheet_id,
                             addParents=config.GDRIVE_FOLDER_ID,
                             removeParents='root',
                             fields='id, parents'
-                        ).execute()
-                        print(f"Moved spreadsheet to folder: {folder.get('name')}")
+                        ))
+                        logger.info("Moved spreadsheet to folder: %s", folder.get('name'))
                     else:
-                        print(f"Warning: The provided folder ID is not a folder. Spreadsheet created in root.")
+                        logger.warning("The provided folder ID is not a folder. Spreadsheet created in root.")
                 except Exception as e:
-                    print(f"Warning: Could not move spreadsheet to folder. Error: {str(e)}")
+                    logger.warning("Could not move spreadsheet to folder. Error: %s", e)
         
         # Get existing worksheets
         existing_worksheets = {worksheet.title: worksheet for worksheet in spreadsheet.worksheets()}
-        excel_sheet_names = list(excel_data.keys())
         
-        # First, make sure we have at least one worksheet
-        # If spreadsheet has no worksheets, add a temporary one
-        if not existing_worksheets:
-            temp_worksheet = spreadsheet.add_worksheet(title="Temp", rows=1, cols=1)
-            existing_worksheets["Temp"] = temp_worksheet
-        
-        # Process each worksheet from the Excel file
-        processed_sheets = []
-        
-        for sheet_name, df in excel_data.items():
-            # Skip certain sheets like graph sheets
-            if sheet_name.endswith('-Graphs'):
-                print(f"Skipping graph sheet '{sheet_name}'")
-                continue
-            
-            processed_sheets.append(sheet_name)
-            
-            # Clean the dataframe
-            values = _clean_dataframe(df)
-            
-            if sheet_name in existing_worksheets:
-                # Update existing worksheet
-                print(f"Updating existing worksheet: {sheet_name}")
-                worksheet = existing_worksheets[sheet_name]
-                try:
-                    worksheet.clear()
-                    worksheet.update(values)
-                except Exception as e:
-                    print(f"Error updating existing worksheet: {str(e)}")
-                    # Try deleting and recreating the worksheet
-                    try:
-                        spreadsheet.del_worksheet(worksheet)
-                        worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=len(values), cols=len(values[0]))
-                        worksheet.update(values)
-                        print(f"Recreated worksheet: {sheet_name}")
-                    except Exception as inner_e:
-                        print(f"Failed to recreate worksheet: {str(inner_e)}")
+        # Clean each worksheet from the Excel file. Sheets that only have a
+        # header row don't get a new worksheet, but existing worksheets are
+        # kept and cut down to the header so no stale rows are left behind.
+        sheet_values = {}
+        header_only_values = {}
+        for ws_name, df in excel_data.items():
+            if df.empty and ws_name not in existing_worksheets:
+                header_only_values[ws_name] = _clean_dataframe(df)
             else:
-                # Create new worksheet
-                print(f"Adding new worksheet: {sheet_name}")
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=len(values), cols=len(values[0]))
-                worksheet.update(values)
+                sheet_values[ws_name] = _clean_dataframe(df)
         
-        # Remove unused worksheets
-        for ws_title, worksheet in existing_worksheets.items():
-            if ws_title not in processed_sheets:
-                print(f"Removing unused worksheet: {ws_title}")
-                spreadsheet.del_worksheet(worksheet)
+        if sheet_values:
+            for ws_name in header_only_values:
+                logger.info("Skipping empty sheet '%s'", ws_name)
+        else:
+            # A spreadsheet needs at least one worksheet, so when no sheet can
+            # be kept, add the header-only ones in place of the old worksheets
+            sheet_values = header_only_values
+        
+        # Collect all structural changes into one batch: size every worksheet
+        # to exactly fit its data (which also drops any stale cells), add the
+        # missing ones and remove the unused ones. Requests are applied in
+        # order, so the spreadsheet never runs out of worksheets.
+        structure_requests = []
+        for ws_name, values in sheet_values.items():
+            grid_properties = {'rowCount': len(values), 'columnCount': max(len(values[0]), 1)}
+            if ws_name in existing_worksheets:
+                logger.info("Updating existing worksheet: %s", ws_name)
+                structure_requests.append({'updateSheetProperties': {
+                    'properties': {
+                        'sheetId': existing_worksheets[ws_name].id,
+                        'gridProperties': grid_properties
+                    },
+                    'fields': 'gridProperties(rowCount,columnCount)'
+                }})
+            else:
+                logger.info("Adding new worksheet: %s", ws_name)
+                structure_requests.append({'addSheet': {
+                    'properties': {'title': ws_name, 'gridProperties': grid_properties}
+                }})
+        
+        if sheet_values:
+            for ws_title, worksheet in existing_worksheets.items():
+                if ws_title not in sheet_values:
+                    logger.info("Removing unused worksheet: %s", ws_title)
+                    structure_requests.append({'deleteSheet': {'sheetId': worksheet.id}})
+        
+        sheets_service = _sheets_service(creds)
+        if structure_requests:
+            retry_execute(sheets_service.spreadsheets().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={'requests': structure_requests}
+            ))
+        
+        # Write the data of all worksheets
+        if sheet_values:
+            _write_sheet_values(creds, sheets_service, sheet_id, sheet_values)
         
         # Share with user if email is provided
-        if config.USER_EMAIL:
-            drive_service = build('drive', 'v3', credentials=creds)
-            try:
-                drive_service.permissions().create(
-                    fileId=sheet_id,
-                    body={'type': 'user', 'role': 'writer', 'emailAddress': config.USER_EMAIL},
-                    fields='id'
-                ).execute()
-                print(f"Shared spreadsheet with {config.USER_EMAIL}")
-            except Exception as e:
-                print(f"Warning: Could not share with user: {str(e)}")
+        if share:
+            share_with_users(creds, [sheet_id])
         
         return sheet_id
         
@@ -314,25 +753,33 @@ def update_google_sheet(file_path: Union[str, Path], sheet_id: Optional[str] = N
         raise IOError(f"Error updating Google Sheet: {str(e)}")
 
 
-def upload_to_gdrive(file_path: Union[str, Path], file_name: Optional[str] = None) -> Optional[str]:
+def upload_to_gdrive(file_path: Union[str, Path, BinaryIO], file_name: Optional[str] = None,
+                     share: bool = True) -> Optional[str]:
     """Upload a file to Google Drive.
     
     Args:
-        file_path: Path to the file to upload
-        file_name: Name to give the file in Google Drive (if None, uses the original filename)
+        file_path: Path to the file to upload, or a binary stream (e.g. BytesIO) with its contents
+        file_name: Name to give the file in Google Drive (if None, uses the original filename;
+            required when uploading a stream)
+        share: Whether to share the file with the configured users (default: True)
         
     Returns:
         The ID of the uploaded file, or None if failed
         
     Raises:
         FileNotFoundError: If the file doesn't exist
+        ValueError: If a stream is given without a file_name
         IOError: If there's an error uploading the file
     """
     creds = get_credentials()
     if not creds:
         return None
     
-    if not os.path.exists(file_path):
+    is_stream = hasattr(file_path, 'read')
+    if is_stream:
+        if not file_name:
+            raise ValueError("file_name is required when uploading a stream")
+    elif not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
     
     if not file_name:
@@ -340,7 +787,7 @@ def upload_to_gdrive(file_path: Union[str, Path], file_name: Optional[str] = Non
     
     try:
         # Create Drive API service
-        drive_service = build('drive', 'v3', credentials=creds)
+        drive_service = _drive_service(creds)
         
         # Create file metadata
         file_metadata = {
@@ -348,29 +795,56 @@ def upload_to_gdrive(file_path: Union[str, Path], file_name: Optional[str] = Non
             'parents': [config.GDRIVE_FOLDER_ID] if config.GDRIVE_FOLDER_ID else None
         }
         
-        # Create media
-        media = MediaFileUpload(
-            file_path,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            resumable=True
-        )
+        # Small files are read once and sent in a single request; large ones
+        # are streamed from disk in a chunked resumable session
+        if is_stream:
+            file_size = file_path.seek(0, os.SEEK_END)
+            file_path.seek(0)
+        else:
+            file_size = os.path.getsize(file_path)
+        resumable = file_size >= config.GDRIVE_RESUMABLE_THRESHOLD
+        if is_stream:
+            media = MediaIoBaseUpload(
+                file_path,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                chunksize=config.GDRIVE_UPLOAD_CHUNKSIZE,
+                resumable=resumable
+            )
+        elif resumable:
+            media = MediaFileUpload(
+                file_path,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                chunksize=config.GDRIVE_UPLOAD_CHUNKSIZE,
+                resumable=True
+            )
+        else:
+            media = MediaInMemoryUpload(
+                Path(file_path).read_bytes(),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                resumable=False
+            )
         
         # Upload file
-        file = drive_service.files().create(
+        request = drive_service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id'
-        ).execute()
+        )
+        if resumable:
+            # Transient errors are retried per chunk without restarting the upload
+            file = None
+            while file is None:
+                status, file = request.next_chunk(num_retries=5)
+                if status:
+                    logger.info("Uploaded %s%% of %s", int(status.progress() * 100), file_name)
+        else:
+            file = retry_execute(request)
         
         # Share the file with the user
-        if config.USER_EMAIL:
-            drive_service.permissions().create(
-                fileId=file.get('id'),
-                body={'type': 'user', 'role': 'writer', 'emailAddress': config.USER_EMAIL},
-                fields='id'
-            ).execute()
+        if share:
+            share_with_users(creds, [file.get('id')])
         
-        print(f"Uploaded file to Google Drive with ID: {file.get('id')}")
+        logger.info("Uploaded file to Google Drive with ID: %s", file.get('id'))
         return file.get('id')
         
     except Exception as e:
@@ -393,19 +867,25 @@ def sync_to_google(sheet_id: Optional[str] = None, upload_to_drive: bool = False
         FileNotFoundError: If the master file doesn't exist
         IOError: If there's an error during sync
     """
+    config.validate_paths()
     if not os.path.exists(config.MASTER_FILE):
         raise FileNotFoundError(f"Master file not found: {config.MASTER_FILE}")
     
+    load_saved_config()
+    
     # Use the sheet_id from config if none is provided and config has one
     if not sheet_id and config.SHEET_ID:
         sheet_id = config.SHEET_ID
-        print(f"Using existing Google Sheet ID from config: {sheet_id}")
+        logger.info("Using existing Google Sheet ID from config: %s", sheet_id)
     
+    # IDs of the files produced so far, shared even if a later step fails
+    produced_ids = []
     try:
         # Update Google Sheet
-        sheet_id = update_google_sheet(config.MASTER_FILE, sheet_id)
+        sheet_id = update_google_sheet(config.MASTER_FILE, sheet_id, share=False)
         if not sheet_id:
             raise IOError("Failed to update Google Sheet")
+        produced_ids.append(sheet_id)
         
         # Save the sheet ID for future use
         save_sheet_id(sheet_id)
@@ -413,19 +893,21 @@ def sync_to_google(sheet_id: Optional[str] = None, upload_to_drive: bool = False
         # Upload to Google Drive if requested
         file_id = None
         if upload_to_drive:
-            file_id = upload_to_gdrive(config.MASTER_FILE)
+            file_id = upload_to_gdrive(config.MASTER_FILE, share=False)
             if not file_id:
                 raise IOError("Failed to upload to Google Drive")
+            produced_ids.append(file_id)
         
         return sheet_id, file_id
         
     except Exception as e:
         raise IOError(f"Error during sync: {str(e)}")
+    finally:
+        # Share the sheet and the uploaded file in a single request
+        if produced_ids:
+            share_with_users(get_credentials(), produced_ids)
 
 
-# Load saved configuration at import time
-load_saved_config()
-
 if __name__ == "__main__":
     # Only update Google Sheet by default, without uploading to Drive
     import argparse
@@ -435,8 +917,10 @@ if __name__ == "__main__":
                        help="Also upload Excel file to Google Drive")
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
+    load_saved_config()
     sheet_id, file_id = sync_to_google(upload_to_drive=args.upload_to_drive)
     if sheet_id:
-        print(f"Synced to Google Sheet: {sheet_id}")
+        logger.info("Synced to Google Sheet: %s", sheet_id)
         if file_id:
-            print(f"Uploaded to Google Drive: {file_id}") 
\ No newline at end of file
+            logger.info("Uploaded to Google Drive: %s", file_id)
\ No newline at end of file
@@ -6,15 +6,17 @@ This script orchestrates the data processing pipeline and Google Drive/Sheets sy
 
 # Standard library imports
 import argparse
+import logging
 from typing import Optional, Tuple
 
 # Local imports
 import config
 from append import append_to_master
 from analysis import DataAnalyzer
-from gdrive_sync import sync_to_google
 
 
+logger = logging.getLogger(__name__)
+
 def run_all(sync_to_cloud: bool = True, sheet_id: Optional[str] = None, 
             upload_to_drive: bool = False) -> Tuple[Optional[str], Optional[str]]:
     """Run all data processing and sync operations.
@@ -35,7 +37,7 @@ def run_all(sync_to_cloud: bool = True, sheet_id: Optional[str] = None,
         - file_id: ID of the uploaded file in Google Drive (if upload_to_drive is True)
     """
     try:
-        print(f"Using data folder: {config.DATA_FOLDER_PATH}")
+        logger.info("Using data folder: %s", config.DATA_FOLDER_PATH)
         
         # Run the append_to_master function
         append_to_master()
@@ -45,38 +47,44 @@ def run_all(sync_to_cloud: bool = True, sheet_id: Optional[str] = None,
         analyzer.add_current_price()
         analyzer.add_capacity_allocation()
         analyzer.add_batch_sizes()
+        analyzer.flush()
         
         # Sync to Google Drive/Sheets if requested
         if sync_to_cloud:
+            # The Google client libraries are slow to import, so only load them when syncing
+            from gdrive_sync import load_saved_config, sync_to_google
+            
+            load_saved_config()
+            
             # Use the sheet_id from config if none is provided
             if not sheet_id and config.SHEET_ID:
                 sheet_id = config.SHEET_ID
                 
-            print(f"\nSyncing data to Google Sheets{' and Drive' if upload_to_drive else ''}...")
-            print(f"Using Google Sheet ID: {sheet_id or 'New sheet will be created'}")
+            logger.info("Syncing data to Google Sheets%s...", ' and Drive' if upload_to_drive else '')
+            logger.info("Using Google Sheet ID: %s", sheet_id or 'New sheet will be created')
             
             if upload_to_drive:
-                print(f"Will upload to Drive folder: {config.GDRIVE_FOLDER_ID or 'Root folder'}")
+                logger.info("Will upload to Drive folder: %s", config.GDRIVE_FOLDER_ID or 'Root folder')
             
             sheet_id, file_id = sync_to_google(sheet_id, upload_to_drive=upload_to_drive)
             
             if upload_to_drive:
                 if sheet_id and file_id:
-                    print("Data sync completed successfully!")
+                    logger.info("Data sync completed successfully!")
                     return sheet_id, file_id
                 else:
-                    print("Data sync failed. Check error messages above.")
+                    logger.error("Data sync failed. Check error messages above.")
             else:
                 if sheet_id:
-                    print("Google Sheet update completed successfully!")
+                    logger.info("Google Sheet update completed successfully!")
                     return sheet_id, None
                 else:
-                    print("Google Sheet update failed. Check error messages above.")
+                    logger.error("Google Sheet update failed. Check error messages above.")
         
         return None, None
         
     except Exception as e:
-        print(f"Error in run_all: {str(e)}")
+        logger.error("Error in run_all: %s", e)
         return None, None
 
 
@@ -119,4 +127,5 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
     main()
@@ -4,153 +4,279 @@ Test script for Google Drive and Sheets integration.
 This will help diagnose authentication issues and test the sync functionality.
 """
 
+import functools
+import io
+import logging
 import os
 import sys
 from pathlib import Path
-from gdrive_sync import get_credentials, sync_to_google, update_google_sheet, upload_to_gdrive
+from gdrive_sync import (get_credentials, load_saved_config, save_sheet_id, share_with_users,
+                         sync_to_google, update_google_sheet, upload_to_gdrive)
 import pandas as pd
 import tempfile
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import config  # Import configuration settings
 
-def create_test_excel():
-    """Create a simple test Excel file with some data."""
-    # Create a temporary file
-    temp_dir = tempfile.gettempdir()
-    test_file = Path(temp_dir) / "test_gdrive_sync.xlsx"
-    
-    # Create a simple DataFrame
-    df1 = pd.DataFrame({
+# IDs of the files created by the tests, shared with the user in one batch by main()
+_created_file_ids = []
+
+# Sheets of the test workbook, built once per run
+TEST_SHEETS = {
+    'Sheet1': pd.DataFrame({
         'Name': ['Test 1', 'Test 2', 'Test 3'],
         'Value': [100, 200, 300]
-    })
-    
-    df2 = pd.DataFrame({
+    }),
+    'Sheet2': pd.DataFrame({
         'ID': [1, 2, 3],
         'Description': ['Description 1', 'Description 2', 'Description 3']
-    })
+    }),
+}
+
+def write_test_excel(target):
+    """Write a simple test Excel workbook with some data.
     
+    Args:
+        target: Path or binary stream to write the workbook to
+    """
     # Write to Excel with multiple sheets
-    with pd.ExcelWriter(test_file, engine='openpyxl') as writer:
-        df1.to_excel(writer, sheet_name='Sheet1', index=False)
-        df2.to_excel(writer, sheet_name='Sheet2', index=False)
+    with pd.ExcelWriter(target, engine='xlsxwriter') as writer:
+        for sheet_name, df in TEST_SHEETS.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+@functools.lru_cache(maxsize=1)
+def create_test_excel(temp_dir):
+    """Create a simple test Excel file with some data.
+    
+    The file is only written once per run; later calls return the same path.
     
-    print(f"Created test Excel file at: {test_file}")
+    Args:
+        temp_dir: Directory holding the files of this test run
+    """
+    test_file = Path(temp_dir) / "test_gdrive_sync.xlsx"
+    
+    write_test_excel(test_file)
     return test_file
 
+@functools.lru_cache(maxsize=1)
+def _test_excel_bytes():
+    """Serialize the test workbook in memory, once per run."""
+    buffer = io.BytesIO()
+    write_test_excel(buffer)
+    return buffer.getvalue()
+
+def create_test_excel_bytes():
+    """Create the test Excel workbook in memory, without touching the disk.
+    
+    Returns a new stream on every call, so each test reads it from the start.
+    """
+    return io.BytesIO(_test_excel_bytes())
+
+def _flush(msgs):
+    """Write a test's buffered output in one go.
+    
+    Each test collects its messages and writes them once when it finishes,
+    so the output of tests running concurrently doesn't interleave.
+    
+    Args:
+        msgs: Lines of output collected by the test
+    """
+    if msgs:
+        sys.stdout.write('\n'.join(msgs) + '\n')
+        sys.stdout.flush()
+
 def test_auth():
     """Test Google API authentication."""
-    print("\n=== Testing Google API Authentication ===")
+    msgs = ["\n=== Testing Google API Authentication ==="]
     
-    creds = get_credentials()
-    if creds:
-        print("✅ Authentication successful!")
-        if hasattr(creds, 'service_account_email'):
-            print(f"Using service account: {creds.service_account_email}")
+    try:
+        # gdrive_sync keeps these credentials in memory until they expire, so
+        # the other tests reuse them from their threads, along with the Google
+        # clients built for them, instead of loading the credentials again
+        creds = get_credentials()
+        if creds:
+            msgs.append("✅ Authentication successful!")
+            if hasattr(creds, 'service_account_email'):
+                msgs.append(f"Using service account: {creds.service_account_email}")
+            else:
+                msgs.append("Using OAuth credentials")
+            return True
         else:
-            print("Using OAuth credentials")
-        return True
-    else:
-        print("❌ Authentication failed!")
-        print("Please check that you have either:")
-        print("  - A credentials.json file (for service accounts)")
-        print("  - A client_secret.json file (for OAuth)")
-        return False
+            msgs.append("❌ Authentication failed!")
+            msgs.append("Please check that you have either:")
+            msgs.append("  - A credentials.json file (for service accounts)")
+            msgs.append("  - A client_secret.json file (for OAuth)")
+            return False
+    finally:
+        _flush(msgs)
 
 def test_sheets():
     """Test Google Sheets integration."""
-    print("\n=== Testing Google Sheets Integration ===")
-    
-    test_file = create_test_excel()
+    msgs = ["\n=== Testing Google Sheets Integration ==="]
     
-    # Try to create a new sheet
-    sheet_id = update_google_sheet(test_file, sheet_name="Test Sheet")
-    
-    if sheet_id:
-        print(f"✅ Successfully created Google Sheet with ID: {sheet_id}")
-        print(f"View at: https://docs.google.com/spreadsheets/d/{sheet_id}")
-        return True
-    else:
-        print("❌ Failed to create Google Sheet")
-        return False
+    try:
+        test_file = create_test_excel_bytes()
+        
+        # Try to create a new sheet
+        sheet_id = update_google_sheet(test_file, sheet_name="Test Sheet", share=False)
+        
+        if sheet_id:
+            _created_file_ids.append(sheet_id)
+            msgs.append(f"✅ Successfully created Google Sheet with ID: {sheet_id}")
+            msgs.append(f"View at: https://docs.google.com/spreadsheets/d/{sheet_id}")
+            return True
+        else:
+            msgs.append("❌ Failed to create Google Sheet")
+            return False
+    finally:
+        _flush(msgs)
 
 def test_drive():
     """Test Google Drive integration."""
-    print("\n=== Testing Google Drive Integration ===")
+    msgs = ["\n=== Testing Google Drive Integration ==="]
     
-    test_file = create_test_excel()
+    try:
+        test_file = create_test_excel_bytes()
+        
+        # Try to upload to Google Drive
+        file_id = upload_to_gdrive(test_file, file_name="test_gdrive_sync.xlsx", share=False)
+        
+        if file_id:
+            _created_file_ids.append(file_id)
+            msgs.append(f"✅ Successfully uploaded file to Google Drive with ID: {file_id}")
+            msgs.append(f"View at: https://drive.google.com/file/d/{file_id}/view")
+            return True
+        else:
+            msgs.append("❌ Failed to upload to Google Drive")
+            return False
+    finally:
+        _flush(msgs)
+
+def _parallel_sync(master_file, msgs):
+    """Update the Google Sheet and upload the file to Drive at the same time.
+    
+    An opt-in variant of the sync test (--parallel-sync) for comparing run
+    times with sync_to_google: it calls the same update_google_sheet,
+    upload_to_gdrive and save_sheet_id, but the two independent uploads
+    overlap instead of running one after the other. test_sync checks the
+    same post-conditions for both. The files are shared by main() together
+    with those of the other tests.
+    
+    Args:
+        master_file: Path to the Excel file to sync
+        msgs: Output buffer of the calling test
+        
+    Returns:
+        Tuple of the Google Sheet ID and the Drive file ID
+    """
+    load_saved_config()
     
-    # Try to upload to Google Drive
-    file_id = upload_to_gdrive(test_file)
+    results = {}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = {
+            pool.submit(update_google_sheet, master_file, config.SHEET_ID or None, share=False): 'Google Sheet update',
+            pool.submit(upload_to_gdrive, master_file, share=False): 'Google Drive upload'
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            msgs.append(f"{futures[future]} finished")
     
-    if file_id:
-        print(f"✅ Successfully uploaded file to Google Drive with ID: {file_id}")
-        print(f"View at: https://drive.google.com/file/d/{file_id}/view")
-        return True
-    else:
-        print("❌ Failed to upload to Google Drive")
-        return False
+    sheet_id = results['Google Sheet update']
+    file_id = results['Google Drive upload']
+    if sheet_id:
+        save_sheet_id(sheet_id)
+    _created_file_ids.extend(i for i in (sheet_id, file_id) if i)
+    return sheet_id, file_id
 
-def test_sync(upload_to_drive=True):
+def test_sync(temp_dir=None, upload_to_drive=True, parallel=False):
     """Test the sync_to_google function.
     
+    With parallel=True (--parallel-sync) the sheet update and the Drive upload
+    run concurrently through _parallel_sync instead, for comparison. Either
+    way the test checks that the Sheet ID was saved, as sync_to_google does.
+    
     Args:
+        temp_dir: Directory holding the files of this test run (default: a new
+            temporary directory)
         upload_to_drive: Whether to upload to Google Drive (default: True)
+        parallel: Update the sheet and upload the file concurrently instead of
+            calling sync_to_google (default: False)
     """
-    print("\n=== Testing Full Google Sync ===")
-    if not upload_to_drive:
-        print("Note: Drive upload is disabled for this test")
-    
-    test_file = create_test_excel()
+    if temp_dir is None:
+        with tempfile.TemporaryDirectory(prefix='gdrive_test_') as temp_dir:
+            return test_sync(temp_dir, upload_to_drive, parallel)
     
-    # Temporarily override the FOLDER_PATH used by sync_to_google
-    import gdrive_sync
-    original_path = gdrive_sync.FOLDER_PATH
-    temp_dir = Path(tempfile.gettempdir())
+    parallel = parallel and upload_to_drive
+    msgs = [f"\n=== Testing {'Concurrent Sheet and Drive Sync' if parallel else 'sync_to_google'} ==="]
+    if not upload_to_drive:
+        msgs.append("Note: Drive upload is disabled for this test")
     
-    # Copy the test file to a file named "Master.xlsx" in the temp directory
-    master_file = temp_dir / "Master.xlsx"
-    import shutil
-    shutil.copy(test_file, master_file)
+    # Temporarily override the MASTER_FILE used by sync_to_google
+    original_master_file = config.MASTER_FILE
     
     try:
-        # Override the FOLDER_PATH
-        gdrive_sync.FOLDER_PATH = temp_dir
+        test_file = create_test_excel(temp_dir)
+        msgs.append(f"Using test Excel file at: {test_file}")
+        
+        # Link the test file as "Master.xlsx" in the temp directory, copying it
+        # only where hard links aren't possible
+        master_file = Path(temp_dir) / "Master.xlsx"
+        try:
+            os.link(test_file, master_file)
+        except OSError:
+            import shutil
+            shutil.copy(test_file, master_file)
+        
+        # Override the MASTER_FILE
+        config.MASTER_FILE = master_file
         
         # Run the sync function
-        sheet_id, file_id = sync_to_google(upload_to_drive=upload_to_drive)
+        if parallel:
+            sheet_id, file_id = _parallel_sync(master_file, msgs)
+        else:
+            sheet_id, file_id = sync_to_google(upload_to_drive=upload_to_drive)
         
         if sheet_id:
-            print("✅ Successfully updated Google Sheet")
-            print(f"Sheet ID: {sheet_id}")
-            print(f"Sheet URL: https://docs.google.com/spreadsheets/d/{sheet_id}")
+            # The Sheet ID must be kept for the next sync, in memory and on disk
+            stored_id = config.load_config_store().get('SHEET_ID')
+            if config.SHEET_ID != sheet_id or stored_id != sheet_id:
+                msgs.append(f"❌ Sheet ID not saved (config: {config.SHEET_ID}, store: {stored_id})")
+                return False
+            
+            msgs.append("✅ Successfully updated Google Sheet")
+            msgs.append(f"Sheet ID: {sheet_id}")
+            msgs.append(f"Sheet URL: https://docs.google.com/spreadsheets/d/{sheet_id}")
             
             if upload_to_drive:
                 if file_id:
-                    print("✅ Successfully uploaded to Google Drive")
-                    print(f"File ID: {file_id}")
-                    print(f"File URL: https://drive.google.com/file/d/{file_id}/view")
+                    msgs.append("✅ Successfully uploaded to Google Drive")
+                    msgs.append(f"File ID: {file_id}")
+                    msgs.append(f"File URL: https://drive.google.com/file/d/{file_id}/view")
                     return True
                 else:
-                    print("⚠️ Google Sheet update succeeded but Drive upload failed")
+                    msgs.append("⚠️ Google Sheet update succeeded but Drive upload failed")
                     return False
             else:
                 # If we're not uploading to Drive, file_id should be None
                 if file_id is None:
                     return True
                 else:
-                    print("⚠️ Unexpected file_id when upload_to_drive=False")
+                    msgs.append("⚠️ Unexpected file_id when upload_to_drive=False")
                     return False
         else:
-            print("❌ Failed to sync to Google")
+            msgs.append("❌ Failed to sync to Google")
             return False
     finally:
-        # Restore the original FOLDER_PATH
-        gdrive_sync.FOLDER_PATH = original_path
-        
-        # Clean up the temporary master file
-        if master_file.exists():
-            master_file.unlink()
+        # Restore the original MASTER_FILE
+        config.MASTER_FILE = original_master_file
+        _flush(msgs)
+
+# Tests that can be selected with --test-<name>-only, with their summary labels
+TESTS = {
+    'sheets': ("Google Sheets", test_sheets),
+    'drive': ("Google Drive", test_drive),
+    'sync': ("Sync", test_sync),
+}
 
 def main():
     """Run all tests."""
@@ -160,8 +286,11 @@ def main():
     parser.add_argument("--user-email", type=str, help="Email address to share access with (overrides config)")
     parser.add_argument("--test-sheets-only", action="store_true", help="Only test Google Sheets integration")
     parser.add_argument("--test-drive-only", action="store_true", help="Only test Google Drive integration")
-    parser.add_argument("--test-sync-only", action="store_true", help="Only test full sync functionality")
+    parser.add_argument("--test-sync-only", action="store_true", help="Only test syncing to Sheets and Drive")
     parser.add_argument("--no-drive-upload", action="store_true", help="Skip uploading to Drive during sync test")
+    parser.add_argument("--parallel-sync", action="store_true",
+                        help="Update the sheet and upload to Drive concurrently during sync test, "
+                             "instead of calling sync_to_google")
     
     args = parser.parse_args()
     
@@ -190,46 +319,34 @@ def main():
             sys.exit(1)
         
         # Determine which tests to run
-        run_all = not (args.test_sheets_only or args.test_drive_only or args.test_sync_only)
-        
-        # Run the selected tests
-        sheets_result = True
-        drive_result = True
-        sync_result = True
+        run_all = not any(getattr(args, f"test_{name}_only") for name in TESTS)
+        selected = {name: test for name, test in TESTS.items()
+                    if run_all or getattr(args, f"test_{name}_only")}
         
-        if run_all or args.test_sheets_only:
-            sheets_result = test_sheets()
+        # All files written by the tests go in one directory, removed afterwards
+        with tempfile.TemporaryDirectory(prefix='gdrive_test_') as temp_dir:
+            test_kwargs = {'sync': {'temp_dir': temp_dir,
+                                    'upload_to_drive': not args.no_drive_upload,
+                                    'parallel': args.parallel_sync}}
             
-        if run_all or args.test_drive_only:
-            drive_result = test_drive()
-            
-        if run_all or args.test_sync_only:
-            # Pass the upload_to_drive parameter
-            sync_result = test_sync(upload_to_drive=not args.no_drive_upload)
+            # Run the selected tests concurrently, as they mostly wait on Google's APIs
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                futures = {name: pool.submit(test, **test_kwargs.get(name, {}))
+                           for name, (label, test) in selected.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        
+        # Share everything the tests created in a single batch request
+        share_with_users(get_credentials(), _created_file_ids)
         
         # Print summary
+        summary = [(label, results[name]) for name, (label, test) in selected.items()]
         print("\n=== Test Summary ===")
         print(f"Authentication: ✅ Passed")
-        
-        if run_all or args.test_sheets_only:
-            print(f"Google Sheets:  {'✅ Passed' if sheets_result else '❌ Failed'}")
-            
-        if run_all or args.test_drive_only:
-            print(f"Google Drive:   {'✅ Passed' if drive_result else '❌ Failed'}")
-            
-        if run_all or args.test_sync_only:
-            print(f"Full Sync:      {'✅ Passed' if sync_result else '❌ Failed'}")
+        for label, passed in summary:
+            print(f"{label + ':':<16}{'✅ Passed' if passed else '❌ Failed'}")
         
         # Return exit code based on results
-        tests_run = []
-        if run_all or args.test_sheets_only:
-            tests_run.append(sheets_result)
-        if run_all or args.test_drive_only:
-            tests_run.append(drive_result)
-        if run_all or args.test_sync_only:
-            tests_run.append(sync_result)
-        
-        if all(tests_run):
+        if all(passed for _, passed in summary):
             print("\n✅ All tests passed! Your Google Drive and Sheets integration is working.")
             return 0
         else:
@@ -241,4 +358,5 @@ def main():
         config.USER_EMAIL = original_user_email
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
     sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test script for building the master Excel file.
+This checks that append_to_master and DataAnalyzer keep blank header cells of
+simulation exports blank, and that the analysis skips History rows without a Day.
+"""
+
+import logging
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from openpyxl import Workbook, load_workbook
+from analysis import DataAnalyzer
+from append import append_to_master
+import config  # Import configuration settings
+
+# Sheets of the simulation export, with a blank, unstyled header cell in each
+GAPPED_SHEETS = {
+    'Standard': [['Day', 'Jobs', None, 'Rev'], [1, 2, None, 10], [2, 4, None, 20]],
+    'History': [['Day', 'Description', None, 'Note'], [1, 'Updated product price to $200.', None, 'x']],
+}
+
+# Sheets of a simulation export whose History has rows without a Day
+BLANK_DAY_SHEETS = {
+    'Standard': [['Day', 'Jobs'], [1, 2], [2, 4]],
+    'History': [
+        ['Day', 'Description'],
+        [1, 'Updated product price to $200.'],
+        [None, 'Notes: the price below is a typo, see the next row'],
+        [None, 'Updated product price to $999.'],
+        [2, 'Updated product price to $250.'],
+    ],
+}
+
+def write_export(data_dir, sheets=GAPPED_SHEETS):
+    """Write a simulation export without any styles.
+
+    Args:
+        data_dir: Directory to write the export to
+        sheets: Rows of each sheet, header first (default: GAPPED_SHEETS)
+    """
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, rows in sheets.items():
+        sheet = workbook.create_sheet(sheet_name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(Path(data_dir) / "Sim Day 2.xlsx")
+
+def read_headers(master_file):
+    """Read the header row of every sheet of the master file.
+
+    Args:
+        master_file: Path to the master file
+    """
+    workbook = load_workbook(master_file, read_only=True)
+    try:
+        return {sheet.title: [cell.value for cell in next(sheet.iter_rows(min_row=1, max_row=1))]
+                for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+@contextmanager
+def temp_data_folder(sheets=GAPPED_SHEETS):
+    """Point the data folder and master file at a temporary directory holding an export.
+
+    Args:
+        sheets: Rows of each sheet of the export (default: GAPPED_SHEETS)
+
+    Yields:
+        Path of the temporary data folder
+    """
+    original_data_folder = config.DATA_FOLDER_PATH
+    original_master_file = config.MASTER_FILE
+
+    with tempfile.TemporaryDirectory(prefix='master_test_') as temp_dir:
+        try:
+            config.DATA_FOLDER_PATH = Path(temp_dir)
+            config.MASTER_FILE = Path(temp_dir) / "Master.xlsx"
+            write_export(temp_dir, sheets)
+            yield Path(temp_dir)
+        finally:
+            # Restore the original paths
+            config.DATA_FOLDER_PATH = original_data_folder
+            config.MASTER_FILE = original_master_file
+
+def check_headers(msgs):
+    """Check that the master file has the export's header rows, blank cells included.
+
+    Only the leading columns are compared, as the analysis adds columns to Standard.
+
+    Args:
+        msgs: Output buffer to add failures to
+    """
+    headers = read_headers(config.MASTER_FILE)
+    passed = True
+    for sheet_name, rows in GAPPED_SHEETS.items():
+        header = headers.get(sheet_name) or []
+        if header[:len(rows[0])] != rows[0]:
+            msgs.append(f"❌ {sheet_name} header is {header}, expected {rows[0]}")
+            passed = False
+    return passed
+
+def test_append_gapped_header():
+    """Test appending an export whose header rows have blank cells."""
+    msgs = ["\n=== Testing Append With Gapped Header ==="]
+
+    try:
+        with temp_data_folder():
+            append_to_master()
+            passed = check_headers(msgs)
+    except Exception as e:
+        msgs.append(f"❌ append_to_master failed: {e}")
+        passed = False
+
+    if passed:
+        msgs.append("✅ Gapped headers were appended unchanged")
+    print("\n".join(msgs))
+    return passed
+
+def test_analysis_gapped_header():
+    """Test rewriting a master file whose header rows have blank cells."""
+    msgs = ["\n=== Testing Analysis With Gapped Header ==="]
+
+    try:
+        with temp_data_folder():
+            append_to_master()
+            analyzer = DataAnalyzer()
+            analyzer.add_current_price()
+            analyzer.add_capacity_allocation()
+            analyzer.add_batch_sizes()
+            analyzer.flush()
+            passed = check_headers(msgs)
+    except Exception as e:
+        msgs.append(f"❌ Analysis failed: {e}")
+        passed = False
+
+    if passed:
+        msgs.append("✅ Gapped headers were kept when rewriting the master file")
+    print("\n".join(msgs))
+    return passed
+
+def test_analysis_blank_history_day():
+    """Test the analysis of a History sheet with rows that have no Day."""
+    msgs = ["\n=== Testing Analysis With Blank History Days ==="]
+
+    try:
+        with temp_data_folder(BLANK_DAY_SHEETS):
+            append_to_master()
+            analyzer = DataAnalyzer()
+            analyzer.add_current_price()
+            prices = analyzer.get_sheet('Standard')['Current Price'].tolist()
+            passed = prices == [200, 250]
+            if not passed:
+                msgs.append(f"❌ Current prices are {prices}, expected [200, 250]")
+    except Exception as e:
+        msgs.append(f"❌ Analysis failed: {e}")
+        passed = False
+
+    if passed:
+        msgs.append("✅ History rows without a Day were skipped")
+    print("\n".join(msgs))
+    return passed
+
+def main():
+    """Run all tests."""
+    results = {
+        "Append": test_append_gapped_header(),
+        "Analysis": test_analysis_gapped_header(),
+        "Blank Day": test_analysis_blank_history_day(),
+    }
+
+    # Print summary
+    print("\n=== Test Summary ===")
+    for label, passed in results.items():
+        print(f"{label + ':':<16}{'✅ Passed' if passed else '❌ Failed'}")
+
+    return 0 if all(results.values()) else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
+    sys.exit(main())